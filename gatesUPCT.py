@@ -1,60 +1,169 @@
 import qiskit
+import importlib
+import importlib.util
 import math
 import numpy as np
-from qiskit.quantum_info import Statevector
 import cmath
+import itertools
 import math
-from termcolor import colored
 import random
 from time import perf_counter
 from qiskit import QuantumCircuit, QuantumRegister, transpile
-from qiskit.providers.fake_provider import GenericBackendV2
-from qiskit.visualization import plot_histogram
-from qiskit_ibm_provider import IBMProvider
-from qiskit.circuit.library import QFT
-from colorama import Fore, Style
+import quantum_f
+import qGrover
+
+# Visualization, fake backends and providers are only imported when they are first used (module '__getattr__'), so
+# importing the builders stays fast and does not need 'qiskit_ibm_provider'. 'from gatesUPCT import *' still brings them
+# in (see '__all__' at the end of the file) when their packages are installed.
+_LAZY_IMPORTS = {
+    'Statevector': ('qiskit.quantum_info', 'Statevector'),
+    'GenericBackendV2': ('qiskit.providers.fake_provider', 'GenericBackendV2'),
+    'plot_histogram': ('qiskit.visualization', 'plot_histogram'),
+    'IBMProvider': ('qiskit_ibm_provider', 'IBMProvider'),
+    'QFT': ('qiskit.circuit.library', 'QFT'),
+    'colored': ('termcolor', 'colored'),
+    'Fore': ('colorama', 'Fore'),
+    'Style': ('colorama', 'Style'),
+}
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, attribute = _LAZY_IMPORTS[name]
+    value = getattr(importlib.import_module(module), attribute)
+    globals()[name] = value
+    return value
 
 def get_extended_edges(nodes, edges):
-    def get_neighbors(nodes, edges):
-        neighbors = [[] for _ in range(nodes)]
-        for edge in edges:
-            node1, node2 = edge
-            neighbors[node1].append(node2)
-            neighbors[node2].append(node1)  
-        return neighbors
-    
-    neighborsList = get_neighbors(nodes, edges)
+    ''' Returns a new list with 'edges' followed by the pairs of nodes at distance two (neighbors of neighbors) that are
+        not already linked. The caller's list is not modified. Uses neighbor sets and a set of canonical pairs, so the cost
+        is O(E*d) for maximum degree d.
+    '''
+    neighborsList = [set() for _ in range(nodes)]
+    for node1, node2 in edges:
+        neighborsList[node1].add(node2)
+        neighborsList[node2].add(node1)
 
-    def convert_list(listed):
-        result = []
-        for i in range(len(listed)):
-            neighbors = []
-            for eachNeighbor in listed[i]:
-                neighbors.extend(listed[eachNeighbor])
-            neighbors = list(set(neighbors) - set([i]))
-            result.append(neighbors)
-        return result
+    linkedPairs = {(min(a, b), max(a, b)) for a, b in edges}
+    linksList = list(edges)
+    for node in range(nodes):
+        neighborsFromNeighbors = set()
+        for eachNeighbor in neighborsList[node]:
+            neighborsFromNeighbors |= neighborsList[eachNeighbor]
+        for eachNeighbor in sorted(neighborsFromNeighbors):
+            if eachNeighbor > node and (node, eachNeighbor) not in linkedPairs:
+                linkedPairs.add((node, eachNeighbor))
+                linksList.append((node, eachNeighbor))
+    return linksList
+
+
+def symmetry_breaking_clique(nodes, edges, chromaticSpace, clique=None):
+    ''' Nodes whose colors can be fixed to 0, 1, ... without losing solutions up to a permutation of the colors: 'clique'
+        if given (checked: nodes of the graph, pairwise adjacent, at most 'chromaticSpace' of them), otherwise a greedy
+        clique grown from the highest degree node (at most 'chromaticSpace' nodes)
+    '''
+    neighborsList = [set() for _ in range(nodes)]
+    for node1, node2 in edges:
+        neighborsList[node1].add(node2)
+        neighborsList[node2].add(node1)
+    if clique is not None:
+        clique = list(clique)
+        if len(clique) > chromaticSpace:
+            raise ValueError(f"{clique} has {len(clique)} nodes, it cannot be colored with {chromaticSpace} colors")
+        outside = [node for node in clique if not 0 <= node < nodes]
+        if outside:
+            raise ValueError(f"{outside} are not nodes of the graph (0 ... {nodes - 1})")
+        for i, node1 in enumerate(clique):
+            if any(node2 not in neighborsList[node1] for node2 in clique[i + 1:]):
+                raise ValueError(f"{clique} is not a clique of the graph")
+        return clique
+    if nodes == 0:
+        return []
+    clique = [max(range(nodes), key=lambda node: len(neighborsList[node]))]
+    candidates = set(neighborsList[clique[0]])
+    while candidates and len(clique) < chromaticSpace:
+        node = max(sorted(candidates), key=lambda node: len(neighborsList[node] & candidates))
+        clique.append(node)
+        candidates &= neighborsList[node]
+    return clique
+
+
+
+def symmetry_layout(nodes, edges, chromaticSpace, break_symmetry=False):
+    ''' Node relabelling used by the builders' 'break_symmetry' option. The fixed nodes ('break_symmetry' True for
+        'symmetry_breaking_clique', or a list of nodes forming a clique) move to the end, so the search register is the
+        first (nodes - len(fixed)) * chromaticSpace qubits and the fixed qubits are constants set with X; the edges
+        between fixed nodes are always satisfied and are dropped.
+        Returns (relabelled edges, nodeOrder with the original node of each new index, {new node: fixed color}).
+    '''
+    if break_symmetry is False or break_symmetry is None:
+        return edges, list(range(nodes)), {}
+    clique = symmetry_breaking_clique(nodes, edges, chromaticSpace, None if break_symmetry is True else break_symmetry)
+    nodeOrder = [node for node in range(nodes) if node not in clique] + clique
+    newIndex = {node: i for i, node in enumerate(nodeOrder)}
+    fixedColors = {newIndex[node]: color for color, node in enumerate(clique)}
+    relabelledEdges = [(newIndex[a], newIndex[b]) for a, b in edges if not (a in clique and b in clique)]
+    return relabelledEdges, nodeOrder, fixedColors
 
-    neighborsFromNeighbors = convert_list(neighborsList)
 
-    def add_links(adjacencyList, linksList):
-        transformedList = convert_list(adjacencyList)
-        for node, neighbors in enumerate(transformedList):
-            for eachNeighbor in neighbors:
-                if (node, eachNeighbor) not in linksList and (eachNeighbor, node) not in linksList:
-                    linksList.append((node, eachNeighbor))
-        return linksList
 
-    return add_links(neighborsList, edges)
+def _symmetry_metadata(nodeOrder, fixedColors, chromaticSpace):
+    k = len(fixedColors)
+    return {'search_qubits': (len(nodeOrder) - k) * chromaticSpace, 'node_order': nodeOrder,
+            'fixed_colors': [[nodeOrder[node], color] for node, color in sorted(fixedColors.items())],
+            'expansion': math.factorial(chromaticSpace) // math.factorial(chromaticSpace - k)}
 
 
 
-def oracle_creator_Grover(nodes, edges, chromaticSpace, use_extendedEdges = False):
+def expand_solution(state, metadata, chromaticSpace):
+    ''' Every coloring of the original graph that a solution of a symmetry-broken oracle stands for.
+        'state' is the basis state of the reduced search register (integer index or qiskit bitstring, qubit 0 rightmost)
+        and 'metadata' the 'circuit.metadata' of the oracle. Returns a list of tuples of per-node color masks in the
+        original node order ('metadata["expansion"]' of them, one per way of choosing the colors of the fixed nodes).
+        With the "at least one color" oracles the expansion covers the solutions where the fixed nodes have one color.
+    '''
+    index = int(state.replace(' ', ''), 2) if isinstance(state, str) else int(state)
+    nodeOrder = metadata['node_order']
+    fixedColors = dict(metadata['fixed_colors'])
+    freeNodes = nodeOrder[:len(nodeOrder) - len(fixedColors)]
+    baseMasks = [0] * len(nodeOrder)
+    for i, node in enumerate(freeNodes):
+        baseMasks[node] = (index >> (i * chromaticSpace)) & (2 ** chromaticSpace - 1)
+    for node, color in fixedColors.items():
+        baseMasks[node] = 1 << color
+    expanded = []
+    for images in itertools.permutations(range(chromaticSpace), len(fixedColors)):
+        permutation = list(images) + [color for color in range(chromaticSpace) if color not in images]
+        expanded.append(tuple(sum(1 << permutation[color] for color in range(chromaticSpace) if (mask >> color) & 1)
+                              for mask in baseMasks))
+    return expanded
+
+
+
+def _other_search_qubits(searchQubits, qubitGroup, mcx_strategy, limit=None):
+    # idle search qubits for an MCX on 'qubitGroup'; only listed when the strategy can use them, and at most 'limit'
+    # (the ancillas the MCX can use), so the list does not cost O(nodes*colors) for every gate
+    if mcx_strategy not in ('v-chain-dirty', 'auto'):
+        return ()
+    group = set(qubitGroup)
+    return list(itertools.islice((q for q in range(searchQubits) if q not in group), None if limit is None else max(0, limit)))
+
+
+
+
+def oracle_creator_Grover(nodes, edges, chromaticSpace, use_extendedEdges = False, mcx_strategy = 'noancilla',
+                          break_symmetry = False):
+    ''' 'mcx_strategy' selects the decomposition of the node and middle MCX gates (see 'quantum_f.mcx'); the idle
+        qubits at each point (clause ancillas not computed yet, search qubits of other nodes) are passed as ancillas.
+        'break_symmetry' fixes the colors of a clique (see 'symmetry_layout'): the search register and the diffuser
+        shrink to 'circuit.metadata["search_qubits"]' and 'expand_solution' gives back the full colorings.
+    '''
 
     if use_extendedEdges:
         extendedEdges = get_extended_edges(nodes, edges)
     else:
         extendedEdges = edges
+    extendedEdges, nodeOrder, fixedColors = symmetry_layout(nodes, extendedEdges, chromaticSpace, break_symmetry)
 
     
     totalCircuitLength = (nodes * chromaticSpace) + nodes + (len(extendedEdges) * chromaticSpace) + 1
@@ -72,6 +181,8 @@ def oracle_creator_Grover(nodes, edges, chromaticSpace, use_extendedEdges = Fals
         return initialQuantumCircuit  
 
     initialCircuit = create_initial_quantum_circuit(numberOfEdges, chromaticSpace, nodes)
+    for node, color in fixedColors.items():
+        initialCircuit.x(node * chromaticSpace + color)
 
     # Add first color constraint
     ancillaPositions = []
@@ -88,7 +199,9 @@ def oracle_creator_Grover(nodes, edges, chromaticSpace, use_extendedEdges = Fals
     for qubitGroup in qubitsList:
         for eachQubit in qubitGroup:
             initialCircuit.x(eachQubit)
-        initialCircuit.mcx(list(qubitGroup), ancillaQubitIndex)  
+        quantum_f.mcx(initialCircuit, list(qubitGroup), ancillaQubitIndex, mcx_strategy,
+                      clean_qbits=range(ancillaQubitIndex + 1, totalCircuitLength),
+                      dirty_qbits=_other_search_qubits(nodes * chromaticSpace, qubitGroup, mcx_strategy, len(qubitGroup) - 2))
         ancillaPositions.append(ancillaQubitIndex)
         for eachQubit in qubitGroup:
             initialCircuit.x(eachQubit)
@@ -109,7 +222,8 @@ def oracle_creator_Grover(nodes, edges, chromaticSpace, use_extendedEdges = Fals
 
     def create_middle_circuit(initialCircuit, ancillaPositions, ancillaQubitIndex):
         quantumSupportCircuit = QuantumCircuit(totalCircuitLength)
-        quantumSupportCircuit.mcx(ancillaPositions, ancillaQubitIndex)
+        quantum_f.mcx(quantumSupportCircuit, ancillaPositions, ancillaQubitIndex, mcx_strategy,
+                      dirty_qbits=range(nodes * chromaticSpace))
         return quantumSupportCircuit
     
     middleCircuit = create_middle_circuit(initialCircuit, ancillaPositions, ancillaQubitIndex)
@@ -141,47 +255,86 @@ def oracle_creator_Grover(nodes, edges, chromaticSpace, use_extendedEdges = Fals
         
         return diffuser
     
-    diffuserCircuit = create_diffuser(nodes * chromaticSpace)
+    searchQubits = (nodes - len(fixedColors)) * chromaticSpace
+    diffuserCircuit = create_diffuser(searchQubits)
 
-    oraclePlusDiffuser = oracleCircuit.compose(diffuserCircuit, range(0, (nodes * chromaticSpace)), front=False)
+    oraclePlusDiffuser = oracleCircuit.compose(diffuserCircuit, range(0, searchQubits), front=False)
+    if fixedColors:
+        oraclePlusDiffuser.metadata = _symmetry_metadata(nodeOrder, fixedColors, chromaticSpace)
 
     return oraclePlusDiffuser
 
 
 
-def grover_search(oracle, m, n):
-    
+def grover_search(oracle, m, n, iterations=None, mode='block'):
+    ''' Grover search with 'oracle' (as built by 'oracle_creator_Grover') over the first 'n' qubits, for 'm' solutions.
+        The number of iterations is planned from the search space 2^n with 'qGrover.optimal_iterations' unless given.
+        'mode' is 'block' (the oracle converted once to a gate and appended every iteration) or 'flat' (every gate inlined);
+        use 'grover_assembly' to keep the structure for transpiling or simulating the block only once.
+    '''
+    assembly = grover_assembly(oracle, m, n, iterations)
+    return assembly.block_circuit() if mode == 'block' else assembly.flat_circuit()
 
 
-    GroverCircuit = QuantumCircuit(oracle.num_qubits, n)
-    GroverCircuit.x(-1)
-    GroverCircuit.h(-1)
 
+def grover_assembly(oracle, m, n, iterations=None):
+    ''' 'qGrover.GroverAssembly' of 'grover_search': output qubit in |->, H on the search register, oracle repeated '''
+    preparation = QuantumCircuit(oracle.num_qubits)
+    preparation.x(-1)
+    preparation.h(-1)
     for qubit in range(n):
-        GroverCircuit.h(qubit)
-    
+        preparation.h(qubit)
 
-    numberOfRepetitions = math.ceil(math.pi/4 * math.sqrt(oracle.num_qubits/m))
+    numberOfRepetitions = qGrover.optimal_iterations(n, m) if iterations is None else iterations
+    return qGrover.GroverAssembly(oracle, range(n), numberOfRepetitions, preparation, measure=True)
 
-    oracle_gate = oracle.to_gate()
-    
 
-    for _ in range(numberOfRepetitions):
-        GroverCircuit.append(oracle_gate, range(oracle.num_qubits))
-     
-    GroverCircuit.measure(range(n), range(n))
 
-    return GroverCircuit
+def quantum_counting(oracle, n, t):
+    ''' Quantum counting circuit: phase estimation with 't' counting qubits of the Grover iteration 'oracle'
+        (built by 'oracle_creator_Grover', search register in its first 'n' qubits, output qubit last).
+        The counting register is placed after the oracle qubits and measured into 't' classical bits.
+    '''
+    countingQubits = list(range(oracle.num_qubits, oracle.num_qubits + t))
+    CountingCircuit = QuantumCircuit(oracle.num_qubits + t, t)
+    CountingCircuit.x(oracle.num_qubits - 1)
+    CountingCircuit.h(oracle.num_qubits - 1)
+    for qubit in list(range(n)) + countingQubits:
+        CountingCircuit.h(qubit)
+
+    controlledGrover = oracle.to_gate(label='G').control(1)
+    for j, countingQubit in enumerate(countingQubits):
+        for _ in range(2 ** j):
+            CountingCircuit.append(controlledGrover, [countingQubit] + list(range(oracle.num_qubits)))
+
+    from qiskit.circuit.library import QFT
+    CountingCircuit.append(QFT(t, inverse=True), countingQubits)
+    CountingCircuit.measure(countingQubits, range(t))
+    return CountingCircuit
 
 
 
+def estimate_solutions(counts, n, t):
+    ''' Number of solutions estimated from the counts of 'quantum_counting' (most frequent outcome).
+        The diffuser is I - 2|s><s|, so the eigenphases of the iteration are pi +- 2*theta and m = 2^n * cos^2(pi*y/2^t)
+    '''
+    y = int(max(counts, key=counts.get).replace(' ', ''), 2)
+    return 2 ** n * math.cos(math.pi * y / 2 ** t) ** 2
+
 
-def oracle_creator(nodes, edges, chromaticSpace, use_extendedEdges = False):
+
+def oracle_creator(nodes, edges, chromaticSpace, use_extendedEdges = False, mcx_strategy = 'noancilla', break_symmetry = False):
+    ''' 'mcx_strategy' selects the decomposition of the node and middle MCX gates (see 'quantum_f.mcx'); the idle
+        qubits at each point (clause ancillas not computed yet, search qubits of other nodes) are passed as ancillas.
+        'break_symmetry' fixes the colors of a clique with X gates on their qubits (see 'symmetry_layout'), which are
+        no longer part of the search register; the layout is described in 'circuit.metadata' for 'expand_solution'.
+    '''
 
     if use_extendedEdges:
         extendedEdges = get_extended_edges(nodes, edges)
     else:
         extendedEdges = edges
+    extendedEdges, nodeOrder, fixedColors = symmetry_layout(nodes, extendedEdges, chromaticSpace, break_symmetry)
     
     totalCircuitLength = (nodes * chromaticSpace) + nodes + (len(extendedEdges) * chromaticSpace) + 1
     numberOfEdges = len(extendedEdges)
@@ -198,6 +351,8 @@ def oracle_creator(nodes, edges, chromaticSpace, use_extendedEdges = False):
         return initialQuantumCircuit  
 
     initialCircuit = create_initial_quantum_circuit(numberOfEdges, chromaticSpace, nodes)
+    for node, color in fixedColors.items():
+        initialCircuit.x(node * chromaticSpace + color)
     initialCircuit.barrier()
 
     ancillaPositions = []
@@ -214,7 +369,9 @@ def oracle_creator(nodes, edges, chromaticSpace, use_extendedEdges = False):
     for qubitGroup in qubitsList:
         for eachQubit in qubitGroup:
             initialCircuit.x(eachQubit)
-        initialCircuit.mcx(qubitGroup, ancillaQubitIndex)
+        quantum_f.mcx(initialCircuit, qubitGroup, ancillaQubitIndex, mcx_strategy,
+                      clean_qbits=range(ancillaQubitIndex + 1, totalCircuitLength),
+                      dirty_qbits=_other_search_qubits(nodes * chromaticSpace, qubitGroup, mcx_strategy, len(qubitGroup) - 2))
         ancillaPositions.append(ancillaQubitIndex)
         for eachQubit in qubitGroup:
             initialCircuit.x(eachQubit)
@@ -236,7 +393,8 @@ def oracle_creator(nodes, edges, chromaticSpace, use_extendedEdges = False):
 
     def create_middle_circuit(initialCircuit, ancillaPositions, ancillaQubitIndex):
         quantumSupportCircuit = QuantumCircuit(totalCircuitLength)
-        quantumSupportCircuit.mcx(ancillaPositions, ancillaQubitIndex)
+        quantum_f.mcx(quantumSupportCircuit, ancillaPositions, ancillaQubitIndex, mcx_strategy,
+                      dirty_qbits=range(nodes * chromaticSpace))
         quantumSupportCircuit.barrier()
         return quantumSupportCircuit
     
@@ -244,10 +402,114 @@ def oracle_creator(nodes, edges, chromaticSpace, use_extendedEdges = False):
 
     finalCircuitCombination = middleCircuit.compose(initialCircuit, range(0, totalCircuitLength), front=True)
     finalCircuitCombination.z(-1)
+    if fixedColors:
+        finalCircuitCombination.metadata = _symmetry_metadata(nodeOrder, fixedColors, chromaticSpace)
 
     return finalCircuitCombination
 
 
+def _constraint_blocks(nodeGroups, expandedEdges, firstNodeAncilla, firstEdgeAncilla):
+    # gate list of the first color constraint for 'nodeGroups' and of the second one for 'expandedEdges':
+    # ('x', qubit), ('mcx', controls, target) and ('ccx', control1, control2, target), as in 'oracle_creator'
+    ops = []
+    for ancillaQubitIndex, qubitGroup in enumerate(nodeGroups, start=firstNodeAncilla):
+        ops.extend(('x', qubit) for qubit in qubitGroup)
+        ops.append(('mcx', tuple(qubitGroup), ancillaQubitIndex))
+        ops.extend(('x', qubit) for qubit in qubitGroup)
+        ops.append(('x', ancillaQubitIndex))
+        ops.append(('barrier',))
+    for ancillaQubitIndex, (qubit1, qubit2) in enumerate(expandedEdges, start=firstEdgeAncilla):
+        ops.append(('ccx', qubit1, qubit2, ancillaQubitIndex))
+        ops.append(('x', ancillaQubitIndex))
+        ops.append(('barrier',))
+    return ops
+
+
+
+def _append_gate_list(circuit, ops, barriers, reverse=False):
+    # appends a gate list built by '_constraint_blocks' with shared gate objects ('copy=False'), qubits given as Qubit
+    # objects so that 'append' does not have to resolve indexes
+    qubits = circuit.qubits
+    xGate, ccxGate, mcxGates = qiskit.circuit.library.XGate(), qiskit.circuit.library.CCXGate(), {}
+    barrier = qiskit.circuit.Barrier(len(qubits))
+    for op in (reversed(ops) if reverse else ops):
+        kind = op[0]
+        if kind == 'x':
+            circuit.append(xGate, (qubits[op[1]],), copy=False)
+        elif kind == 'ccx':
+            circuit.append(ccxGate, (qubits[op[1]], qubits[op[2]], qubits[op[3]]), copy=False)
+        elif kind == 'mcx':
+            controls = op[1]
+            if len(controls) not in mcxGates:
+                mcxGates[len(controls)] = qiskit.circuit.library.MCXGate(len(controls))
+            circuit.append(mcxGates[len(controls)], tuple(qubits[q] for q in controls) + (qubits[op[2]],), copy=False)
+        elif barriers:
+            circuit.append(barrier, qubits, copy=False)
+
+
+
+def oracle_creator_parallel(nodes, edges, chromaticSpace, use_extendedEdges = False, grover = False, barriers = False,
+                            workers = None, break_symmetry = False):
+    ''' Fast construction of 'oracle_creator' ('grover' False) or 'oracle_creator_Grover' ('grover' True) for large graphs.
+
+        The per-node and per-edge constraint blocks are generated as compact gate lists, in 'workers' processes when
+        given (chunks of nodes and edges, with their ancilla offsets precomputed), and appended once into a single
+        circuit with shared gate objects. The uncompute of the Grover version is the same gate list in reverse order
+        (every gate is self-inverse), so there is no 'compose(front=True)' or 'reverse_ops()' copy of the circuit.
+        Barriers are only emitted with 'barriers' True, and never in the Grover version ('oracle_creator_Grover' has
+        none); with them the circuit is the same as the one of the original builder.
+    '''
+    barriers = barriers and not grover
+    if use_extendedEdges:
+        extendedEdges = get_extended_edges(nodes, edges)
+    else:
+        extendedEdges = edges
+    extendedEdges, nodeOrder, fixedColors = symmetry_layout(nodes, extendedEdges, chromaticSpace, break_symmetry)
+
+    searchQubits = nodes * chromaticSpace
+    totalCircuitLength = searchQubits + nodes + (len(extendedEdges) * chromaticSpace) + 1
+    nodeGroups = [list(range(node * chromaticSpace, (node + 1) * chromaticSpace)) for node in range(nodes)]
+    expandedEdges = [(edge[0] * chromaticSpace + i, edge[1] * chromaticSpace + i) for edge in extendedEdges
+                     for i in range(chromaticSpace)]
+
+    firstEdgeAncilla = searchQubits + nodes
+    if workers:
+        import concurrent.futures
+        nodeChunk = max(1, -(-len(nodeGroups) // workers))
+        edgeChunk = max(1, -(-len(expandedEdges) // workers))
+        jobs = [(nodeGroups[i:i + nodeChunk], [], searchQubits + i, 0) for i in range(0, len(nodeGroups), nodeChunk)]
+        jobs += [([], expandedEdges[i:i + edgeChunk], 0, firstEdgeAncilla + i) for i in range(0, len(expandedEdges), edgeChunk)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            ops = [op for chunk in pool.map(_constraint_blocks, *zip(*jobs)) for op in chunk]
+    else:
+        ops = _constraint_blocks(nodeGroups, expandedEdges, searchQubits, firstEdgeAncilla)
+    ops = [('x', node * chromaticSpace + color) for node, color in fixedColors.items()] + \
+          ([('barrier',)] if not grover else []) + ops
+
+    oracleCircuit = QuantumCircuit(totalCircuitLength) if grover else QuantumCircuit(totalCircuitLength, 1)
+    _append_gate_list(oracleCircuit, ops, barriers)
+    ancillaPositions = list(range(searchQubits, totalCircuitLength - 1))
+    oracleCircuit.mcx(ancillaPositions, totalCircuitLength - 1)
+    if not grover:
+        if barriers:
+            oracleCircuit.barrier()
+        oracleCircuit.z(-1)
+    else:
+        _append_gate_list(oracleCircuit, ops, False, reverse=True)
+        diffuserQubits = (nodes - len(fixedColors)) * chromaticSpace
+        oracleCircuit.h(range(diffuserQubits))
+        oracleCircuit.x(range(diffuserQubits))
+        oracleCircuit.h(diffuserQubits - 1)
+        oracleCircuit.mcx(list(range(diffuserQubits - 1)), diffuserQubits - 1)
+        oracleCircuit.h(diffuserQubits - 1)
+        oracleCircuit.x(range(diffuserQubits))
+        oracleCircuit.h(range(diffuserQubits))
+    if fixedColors:
+        oracleCircuit.metadata = _symmetry_metadata(nodeOrder, fixedColors, chromaticSpace)
+    return oracleCircuit
+
+
+
 
 def check_solution(colors, color_assignment, oracle):
     circuit = QuantumCircuit(oracle.num_qubits, oracle.num_clbits)  
@@ -266,7 +528,15 @@ def check_solution(colors, color_assignment, oracle):
 
 
 
-def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False):
+def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False, break_symmetry = False, mcx_strategy = 'noancilla'):
+    ''' 'break_symmetry' fixes the colors of a clique (see 'symmetry_layout'): their qubits get X instead of H, so the
+        superposition covers only 'circuit.metadata["search_qubits"]' qubits; see 'expand_solution'.
+        'mcx_strategy' selects the decomposition of the counter MCX gates (see 'quantum_f.mcx'); every ancilla of the
+        counters is in use, so only the search qubits outside the gate are passed, as dirty ancillas.
+    '''
+
+    def dirty_search_qubits(controls):
+        return _other_search_qubits(nodes * colors, controls, mcx_strategy, len(controls) - 2)
 
     degree_count = {i: 0 for i in range(nodes)}
 
@@ -282,6 +552,7 @@ def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False):
         extendedEdges = get_extended_edges(nodes, edges)
     else:
         extendedEdges = edges
+    extendedEdges, nodeOrder, fixedColors = symmetry_layout(nodes, extendedEdges, colors, break_symmetry)
 
 
 
@@ -291,7 +562,11 @@ def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False):
     qc = QuantumCircuit(circuitLength, 1)
 
     for qubit in range(nodes * colors):
-        qc.h(qubit)
+        if qubit // colors in fixedColors:
+            if fixedColors[qubit // colors] == qubit % colors:
+                qc.x(qubit)
+        else:
+            qc.h(qubit)
 
     sum1 = (nodes * colors) 
     sum2 = (nodes * colors) + 1
@@ -337,7 +612,8 @@ def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False):
                 if len(current_qubits) == 2:
                     qcaux.ccx(current_qubits[0], current_qubits[1], target_qubit)
                 else:
-                    qcaux.mcx(current_qubits, target_qubit)
+                    quantum_f.mcx(qcaux, current_qubits, target_qubit, mcx_strategy,
+                                  dirty_qbits=dirty_search_qubits(current_qubits))
 
                 level += 1
             qcaux_inverse = qcaux.inverse()
@@ -373,7 +649,7 @@ def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False):
         qc.barrier()
 
     
-    qc.mcx(last_target_qubits, sum1)
+    quantum_f.mcx(qc, last_target_qubits, sum1, mcx_strategy, dirty_qbits=dirty_search_qubits(last_target_qubits))
     for qubit in range(sum3, circuitLength):
         qc.x(qubit)
 
@@ -412,10 +688,12 @@ def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False):
                     control_qubits = list(range(sum2+1, target_qubit))
 
                     if level == 0:
-                        qcaux2.mcx(current_qubits, target_qubit)
+                        quantum_f.mcx(qcaux2, current_qubits, target_qubit, mcx_strategy,
+                                      dirty_qbits=dirty_search_qubits(current_qubits))
                     else:
-
-                        qcaux2.mcx(current_qubits + levels_qubits + control_qubits, target_qubit)
+                        controls = current_qubits + levels_qubits + control_qubits
+                        quantum_f.mcx(qcaux2, controls, target_qubit, mcx_strategy,
+                                      dirty_qbits=dirty_search_qubits(controls))
                         
                 
                 qcaux2_inverse = qcaux2.inverse()
@@ -430,6 +708,8 @@ def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False):
     for qubit in range(sum2, target_qubit+1):
         qc.x(qubit)
     qc.mcp(math.pi, list(range(sum1, (target_qubit))),  target_qubit)
+    if fixedColors:
+        qc.metadata = _symmetry_metadata(nodeOrder, fixedColors, colors)
     
     
     
@@ -440,27 +720,303 @@ def oracle_creator_CdC_OH(nodes, colors, edges, use_extendedEdges = False):
     return qc
 
 
+def oracle_creator_counters(nodes, edges, colors, use_extendedEdges = False, uncompute = True, break_symmetry = False):
+    ''' The counter-based oracle of 'coloreadoGrafos_nodos1Color.ipynb' (exactly one color per node) for any graph,
+        built with the 'qCounters' counters. Node v is the register str(v) of 'colors' qubits (qubit v*colors + k is
+        color k) and the counters share one ancilla register 'a':
+          - condition 1: for each node, a C_Ladder_Counter of its colors on a[0:L1], L1 = bit_length(colors); a C_Counter
+            on a[L1:L1+L2], L2 = bit_length(nodes), counts the nodes whose count is 1; a[0] = (that count == nodes).
+          - condition 2: one C_Ladder_Counter per color over the edges (both ends of the color as triggers), all on
+            a[1:1+L3], L3 = bit_length(number of edges). These qubits are the ones of condition 1 that are |0> whenever
+            a[0] is 1, and with one color per node the shared count grows at most by one per edge, as in the notebook.
+        The phase is applied when a[0] is 1 and the conflict count is 0. With 'uncompute' the compute part is undone
+        after the phase (every ancilla returns to |0>); otherwise the circuit ends at the phase, like 'oracle2'.
+        Ancillas: max(L1 + L2, 1 + L3). 'break_symmetry' as in 'oracle_creator_CdC_OH'.
+    '''
+    import qCounters
+
+    if use_extendedEdges:
+        extendedEdges = get_extended_edges(nodes, edges)
+    else:
+        extendedEdges = edges
+    extendedEdges, nodeOrder, fixedColors = symmetry_layout(nodes, extendedEdges, colors, break_symmetry)
+
+    nodeCounterWidth = colors.bit_length()
+    oneColorCounterWidth = nodes.bit_length()
+    conflictCounterWidth = len(extendedEdges).bit_length()
+    nodeRegisters = [QuantumRegister(colors, str(node)) for node in range(nodes)]
+    ancillas = qiskit.circuit.AncillaRegister(max(nodeCounterWidth + oneColorCounterWidth, 1 + conflictCounterWidth), 'a')
+    oracle = QuantumCircuit(*nodeRegisters, ancillas)
+    for node, color in fixedColors.items():
+        oracle.x(nodeRegisters[node][color])
+
+    # Condition 1: every node has exactly one color
+    nodeCounter = ancillas[:nodeCounterWidth]
+    oneColorCounter = ancillas[nodeCounterWidth:nodeCounterWidth + oneColorCounterWidth]
+    cnt_c2 = qCounters.C_Counter(nodeCounter, oneColorCounter, oracle)
+    for nodeRegister in nodeRegisters:
+        cnt_c1 = qCounters.C_Ladder_Counter([nodeRegister], nodeCounter, oracle)
+        cnt_c1.emit_all(oracle)
+        if nodeCounterWidth > 1:
+            oracle.x(nodeCounter[1:])
+        cnt_c2.next(oracle)
+        if nodeCounterWidth > 1:
+            oracle.x(nodeCounter[1:])
+        cnt_c1.emit_inverse(oracle)
+    zeroBits = [qubit for i, qubit in enumerate(oneColorCounter) if not (nodes >> i) & 1]
+    if zeroBits:
+        oracle.x(zeroBits)
+    oracle.mcx(oneColorCounter, ancillas[0])
+    if zeroBits:
+        oracle.x(zeroBits)
+    # the counter becomes count XOR nodes: all |0> when condition 1 holds
+    oracle.x([qubit for i, qubit in enumerate(oneColorCounter) if (nodes >> i) & 1])
+
+    # Condition 2: no edge with the same color on both ends
+    conflictCounter = ancillas[1:1 + conflictCounterWidth]
+    if extendedEdges:
+        edgeCounters = [qCounters.C_Ladder_Counter([[nodeRegisters[a][color] for a, _ in extendedEdges],
+                                                    [nodeRegisters[b][color] for _, b in extendedEdges]],
+                                                   conflictCounter, oracle)
+                        for color in range(colors)]
+        for _ in extendedEdges:
+            for counter in edgeCounters:
+                counter.next(oracle)
+        oracle.x(conflictCounter)
+
+    computeCircuit = oracle.copy() if uncompute else None
+    if conflictCounterWidth:
+        quantum_f.phase_and(oracle, [ancillas[0], *conflictCounter])
+    else:
+        oracle.z(ancillas[0])
+    if uncompute:
+        oracle.compose(computeCircuit.reverse_ops(), inplace=True)
+    if fixedColors:
+        oracle.metadata = _symmetry_metadata(nodeOrder, fixedColors, colors)
+    return oracle
+
+
+
+
+def oracle_creator_budget(nodes, edges, chromaticSpace, max_qubits=None, use_extendedEdges = False,
+                          mcx_strategy = 'noancilla', report_baseline = False):
+    ''' Variant of 'oracle_creator' that fits in 'max_qubits' qubits by recycling the clause ancillas.
+
+        The clauses (node without color, same color on both ends of an edge) are computed in batches on the same
+        'batchSize' ancillas. After each batch, a counter register (the increment of the 'qCounters' counters) is
+        incremented if no clause of the batch is violated, and the batch is uncomputed. The phase is applied when the
+        counter equals the number of batches, and then everything is uncomputed, so every ancilla returns to |0>.
+        Ancillas grow as batchSize + log2(batches + 1) instead of nodes + E*colors + 1.
+
+        The largest batch that fits in the budget is chosen ('max_qubits' None means one single batch). The trade-off is
+        reported in 'circuit.metadata': qubits, depth and size of this circuit, and qubits and size of 'oracle_creator'
+        for the same graph (in closed form); 'report_baseline' also builds that circuit to report its depth.
+
+        'mcx_strategy' selects the decomposition of the clause, counter and phase MCX gates (see 'quantum_f.mcx'): the
+        batch ancillas after the clause (not computed yet, or already uncomputed) are clean, the search qubits outside
+        the gate dirty, and the whole batch register is clean for the phase.
+    '''
+    if use_extendedEdges:
+        extendedEdges = get_extended_edges(nodes, edges)
+    else:
+        extendedEdges = edges
+
+    searchQubits = nodes * chromaticSpace
+    # clauses: ('node', qubits that cannot all be 0) or ('edge', pair of qubits that cannot both be 1)
+    clauses = [('node', list(range(node * chromaticSpace, (node + 1) * chromaticSpace))) for node in range(nodes)]
+    for eachEdge in extendedEdges:
+        for i in range(chromaticSpace):
+            clauses.append(('edge', [eachEdge[0] * chromaticSpace + i, eachEdge[1] * chromaticSpace + i]))
+
+    def counter_width(batchSize):
+        numberOfBatches = math.ceil(len(clauses) / batchSize)
+        return max(1, numberOfBatches.bit_length())
+
+    batchSize = len(clauses)
+    if max_qubits is not None:
+        while batchSize > 0 and searchQubits + batchSize + counter_width(batchSize) > max_qubits:
+            batchSize -= 1
+        if batchSize == 0:
+            raise ValueError(f"{max_qubits} qubits are not enough: at least {searchQubits + 1 + counter_width(1)} are needed")
+
+    numberOfBatches = math.ceil(len(clauses) / batchSize)
+    counterQubits = list(range(searchQubits + batchSize, searchQubits + batchSize + counter_width(batchSize)))
+    computeCircuit = QuantumCircuit(counterQubits[-1] + 1)
+
+    def add_clauses(batch, reverse=False):
+        # clause i of the batch on ancilla searchQubits + i, also when uncomputing in reverse order
+        numbered = list(enumerate(batch, start=searchQubits))
+        for ancillaQubitIndex, (kind, qubits) in (reversed(numbered) if reverse else numbered):
+            if kind == 'node':
+                quantum_f.nor_gate(computeCircuit, qubits, ancillaQubitIndex, mcx_strategy,
+                                   clean_qbits=range(ancillaQubitIndex + 1, searchQubits + batchSize),
+                                   dirty_qbits=_other_search_qubits(searchQubits, qubits, mcx_strategy, len(qubits) - 2))
+            else:
+                computeCircuit.ccx(qubits[0], qubits[1], ancillaQubitIndex)
+
+    for start in range(0, len(clauses), batchSize):
+        batch = clauses[start:start + batchSize]
+        batchAncillas = list(range(searchQubits, searchQubits + len(batch)))
+        add_clauses(batch)
+        # increment the counter when every clause ancilla of the batch is 0 (no violation)
+        computeCircuit.x(batchAncillas)
+        for i in range(len(counterQubits), 0, -1):
+            controls = batchAncillas + counterQubits[:i - 1]
+            quantum_f.mcx(computeCircuit, controls, counterQubits[i - 1], mcx_strategy,
+                          dirty_qbits=_other_search_qubits(searchQubits, (), mcx_strategy, len(controls) - 2))
+        computeCircuit.x(batchAncillas)
+        add_clauses(batch, reverse=True)
+
+    oracleCircuit = computeCircuit.copy()
+    zeroBits = [qubit for i, qubit in enumerate(counterQubits) if not (numberOfBatches >> i) & 1]
+    if zeroBits:
+        oracleCircuit.x(zeroBits)
+    if len(counterQubits) == 1:
+        oracleCircuit.z(counterQubits[0])
+    else:
+        quantum_f.phase_and(oracleCircuit, counterQubits, mcx_strategy,
+                            clean_qbits=range(searchQubits, searchQubits + batchSize),
+                            dirty_qbits=_other_search_qubits(searchQubits, (), mcx_strategy, len(counterQubits) - 3))
+    if zeroBits:
+        oracleCircuit.x(zeroBits)
+    oracleCircuit.compose(computeCircuit.reverse_ops(), inplace=True)
+
+    # 'oracle_creator': an ancilla per node and per edge clause plus the output qubit; X, MCX, X and X per node, CCX and
+    # X per edge clause, final MCX and Z
+    edgeClauses = len(clauses) - nodes
+    oracleCircuit.metadata = {
+        'batch_size': batchSize, 'batches': numberOfBatches, 'ancillas': oracleCircuit.num_qubits - searchQubits,
+        'qubits': oracleCircuit.num_qubits, 'depth': oracleCircuit.depth(), 'size': oracleCircuit.size(),
+        'baseline_qubits': searchQubits + nodes + edgeClauses + 1,
+        'baseline_size': nodes * (2 * chromaticSpace + 2) + 2 * edgeClauses + 2}
+    if report_baseline:
+        oracleCircuit.metadata['baseline_depth'] = oracle_creator(nodes, edges, chromaticSpace, use_extendedEdges).depth()
+    return oracleCircuit
+
+
+
+def binary_color_bits(colors):
+    ''' Qubits per node of the binary color encoding: ceil(log2(colors)), at least 1 '''
+    return max(1, math.ceil(math.log2(colors)))
+
+
+
+def oracle_creator_binary(nodes, edges, colors, use_extendedEdges = False):
+    ''' Coloring oracle with binary color encoding: node v holds its color as an integer in qubits
+        v*b ... v*b+b-1 (least significant first), b = 'binary_color_bits(colors)', so the search register has
+        nodes*b qubits instead of nodes*colors. Every node has exactly one color by construction.
+
+        Clauses, each on its own ancilla (1 = violated):
+          - edge (u, v): same color. The bits of u are XORed onto v with CX, an MCX with all controls on |0> detects
+            equality, and the CX are undone (comparator without extra ancillas).
+          - node v: value >= colors, only when colors is not a power of two. Constant comparator: one MCX per
+            position where the constant has a 0, plus one for equality; the terms are disjoint so their XOR is the OR.
+        Like 'oracle_creator', the last qubit gets the AND of "no violation" and a Z, and there is one classical bit for
+        'check_solution_binary'; the ancillas are not uncomputed.
+    '''
+    if use_extendedEdges:
+        extendedEdges = get_extended_edges(nodes, edges)
+    else:
+        extendedEdges = edges
+
+    bits = binary_color_bits(colors)
+    searchQubits = nodes * bits
+    checkValidity = colors != 2 ** bits
+    numberOfClauses = len(extendedEdges) + (nodes if checkValidity else 0)
+    totalCircuitLength = searchQubits + numberOfClauses + 1
+    oracleCircuit = QuantumCircuit(totalCircuitLength, 1)
+
+    def node_qubits(node):
+        return list(range(node * bits, (node + 1) * bits))
+
+    ancillaQubitIndex = searchQubits
+    ancillaPositions = []
+
+    if checkValidity:
+        for node in range(nodes):
+            qubits = node_qubits(node)
+            for i in range(bits):
+                # value >= colors because bit i is 1 where colors has a 0 and the higher bits are equal
+                if not (colors >> i) & 1:
+                    higher = list(range(i + 1, bits))
+                    controls = [qubits[j] for j in higher] + [qubits[i]]
+                    ctrlState = ''.join(str((colors >> j) & 1) for j in reversed(higher))
+                    oracleCircuit.mcx(controls, ancillaQubitIndex, ctrl_state='1' + ctrlState if higher else '1')
+            # value == colors
+            oracleCircuit.mcx(qubits, ancillaQubitIndex, ctrl_state=format(colors, f'0{bits}b')[-bits:])
+            ancillaPositions.append(ancillaQubitIndex)
+            ancillaQubitIndex += 1
+        oracleCircuit.barrier()
+
+    for eachEdge in extendedEdges:
+        qubitsA, qubitsB = node_qubits(eachEdge[0]), node_qubits(eachEdge[1])
+        for a, b in zip(qubitsA, qubitsB):
+            oracleCircuit.cx(a, b)
+        oracleCircuit.mcx(qubitsB, ancillaQubitIndex, ctrl_state='0' * bits)
+        for a, b in zip(qubitsA, qubitsB):
+            oracleCircuit.cx(a, b)
+        ancillaPositions.append(ancillaQubitIndex)
+        ancillaQubitIndex += 1
+    oracleCircuit.barrier()
+
+    if ancillaPositions:
+        oracleCircuit.mcx(ancillaPositions, ancillaQubitIndex, ctrl_state='0' * len(ancillaPositions))
+    else:
+        oracleCircuit.x(ancillaQubitIndex)
+    oracleCircuit.barrier()
+    oracleCircuit.z(-1)
+    return oracleCircuit
+
+
+
+def check_solution_binary(colors, color_assignment, oracle):
+    ''' 'check_solution' for 'oracle_creator_binary': loads each color as a binary number and measures the output '''
+    circuit = QuantumCircuit(oracle.num_qubits, oracle.num_clbits)
+    bits = binary_color_bits(colors)
+    for node, color in enumerate(color_assignment):
+        for i in range(bits):
+            if (color >> i) & 1:
+                circuit.x(node * bits + i)
+    circuit.compose(oracle, inplace=True)
+    circuit.measure(oracle.num_qubits - 1, 0)
+    return circuit
+
+
+
+def decode_binary(state, nodes, colors):
+    ''' Colors per node of a basis state of the binary search register, given as an integer index or as a
+        qiskit bitstring (qubit 0 rightmost). Values >= colors are returned as they are (invalid colorings).
+    '''
+    bits = binary_color_bits(colors)
+    index = int(state.replace(' ', ''), 2) if isinstance(state, str) else int(state)
+    return [(index >> (node * bits)) & (2 ** bits - 1) for node in range(nodes)]
+
+
 
 def print_state(statevector, num_cols=0, print_0_prob=False, precision=6):
     ''' Prints the statevector (calculated as 'qiskit.quantum_info.Statevector(qc)' ) showing the kets and their probabilities
         The user can select whether states with 0 probability are to be shown, the number of columns to organize the output,
         and the number of decimal places for the probabilities.
         Numbers in blue have phase 0 and in yellow phase PI.
+        Amplitudes are classified with 'quantum_f.classify_phases'; strings are only built for the states that get printed.
     '''
+    from termcolor import colored
     num_cols = statevector.num_qubits // 2 if num_cols == 0 else num_cols
-    for pos, val in enumerate(statevector.data):
-        prob = abs(val) ** 2
-        phase = cmath.phase(val)
-        txt = f"|{pos:0{statevector.num_qubits}b}\u232A: {prob:.{precision}f}"  
-        fin = '\n' if (pos + 1) % num_cols == 0 else '\t'
-        if math.isclose(prob, 0, abs_tol=1e-6):
-            if print_0_prob:
+    shown = quantum_f.PHASE_CLASSES if print_0_prob else (quantum_f.PHASE_0, quantum_f.PHASE_PI, quantum_f.PHASE_OTHER)
+    for positions, classes, probs, phases in quantum_f.classify_phases(statevector, shown):
+        for pos, cls, prob, phase in zip(positions.tolist(), classes, probs, phases):
+            txt = f"|{pos:0{statevector.num_qubits}b}\u232A: {prob:.{precision}f}"  
+            fin = '\n' if (pos + 1) % num_cols == 0 else '\t'
+            if cls == quantum_f.PHASE_ZERO_PROB:
                 print(colored(txt, 'white'), end=fin)
-        elif math.isclose(phase, 0, abs_tol=1e-6):
-            print(colored(txt, 'blue', attrs=["bold"]), end=fin)
-        elif math.isclose(phase, math.pi, abs_tol=1e-6) or math.isclose(phase, -math.pi, abs_tol=1e-6):
-            print(colored(txt, 'yellow', attrs=["bold"]), end=fin)
-        else:
-            print(colored(txt + f"({phase})", 'red', attrs=["bold"]), end=fin)
+            elif cls == quantum_f.PHASE_0:
+                print(colored(txt, 'blue', attrs=["bold"]), end=fin)
+            elif cls == quantum_f.PHASE_PI:
+                print(colored(txt, 'yellow', attrs=["bold"]), end=fin)
+            else:
+                print(colored(txt + f"({phase})", 'red', attrs=["bold"]), end=fin)
+
 
 
+__all__ = [name for name in list(globals()) if not name.startswith('_')] + \
+          [name for name, (module, _) in _LAZY_IMPORTS.items() if importlib.util.find_spec(module.split('.')[0]) is not None]
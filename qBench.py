@@ -0,0 +1,194 @@
+"""
+Resource and runtime benchmark of the oracle constructions over generated graph families.
+
+For every (family, size, colors, construction) it records qubits, depth, size, gate counts and two-qubit gate counts, both
+for the logical circuit and after the Eagle PassManager of the notebooks, together with the time to build, to transpile
+(whole circuit, and motif by motif with 'qTemplates') and to simulate (classical evaluation of the oracle on every input
+with 'qClassical', checked against 'qSolutions'), and the gates removed by 'qPeephole' with the resources they leave
+after the translation.
+Results are written to JSON so two revisions can be compared with 'compare':
+
+    python qBench.py --out bench_new.json
+    python qBench.py --compare bench_old.json bench_new.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+
+import qiskit
+
+import gatesUPCT
+import qCache
+import qClassical
+import qPeephole
+import qSolutions
+import qTemplates
+
+PAPER_EDGES = [(4, 0), (0, 1), (1, 3), (1, 2), (2, 3), (2, 5)]
+
+
+# Graph families
+
+def path_graph(nodes):
+    return [(i, i + 1) for i in range(nodes - 1)]
+
+def cycle_graph(nodes):
+    return path_graph(nodes) + ([(nodes - 1, 0)] if nodes > 2 else [])
+
+def grid_graph(nodes):
+    ''' Grid with 2 rows (ladder), 'nodes' must be even '''
+    cols = nodes // 2
+    return [(r * cols + c, r * cols + c + 1) for r in range(2) for c in range(cols - 1)] + [(c, cols + c) for c in range(cols)]
+
+def random_graph(nodes, p=0.4, seed=0):
+    rng = random.Random(seed * 1000 + nodes)
+    return [(a, b) for a in range(nodes) for b in range(a + 1, nodes) if rng.random() < p]
+
+FAMILIES = {'path': path_graph, 'cycle': cycle_graph, 'grid': grid_graph, 'random': random_graph}
+
+
+# Constructions: (builder(nodes, edges, colors) -> oracle circuit, one_color semantics, needs uncompute to be checked)
+
+CONSTRUCTIONS = {
+    'oracle_creator': (lambda n, e, c: gatesUPCT.oracle_creator(n, e, c), False, True),
+    'oracle_creator_Grover': (lambda n, e, c: gatesUPCT.oracle_creator_Grover(n, e, c), False, False),
+    'oracle_creator_CdC_OH': (lambda n, e, c: gatesUPCT.oracle_creator_CdC_OH(n, c, e), True, True),
+    'oracle_creator_parallel': (lambda n, e, c: gatesUPCT.oracle_creator_parallel(n, e, c), False, True),
+    'qCounters': (lambda n, e, c: gatesUPCT.oracle_creator_counters(n, e, c, uncompute=False), True, True),
+}
+
+
+def _two_qubit_gates(circuit):
+    return sum(1 for inst in circuit.data if len(inst.qubits) == 2 and inst.operation.name != 'barrier')
+
+
+def _resources(circuit):
+    ops = circuit.count_ops()
+    ops.pop('barrier', None)
+    return {'qubits': circuit.num_qubits, 'depth': circuit.depth(), 'size': circuit.size(),
+            'gates': dict(ops), 'two_qubit_gates': _two_qubit_gates(circuit)}
+
+
+def bench_one(construction, nodes, edges, colors, max_simulated_qubits=20, transpile=True):
+    ''' Benchmark record of one construction on one graph, or None if the construction does not apply '''
+    builder, one_color, uncompute = CONSTRUCTIONS[construction]
+    start = time.perf_counter()
+    oracle = builder(nodes, edges, colors)
+    build_time = time.perf_counter() - start
+    if oracle is None:
+        return None
+    record = {'construction': construction, 'nodes': nodes, 'edges': len(edges), 'colors': colors,
+              'build_time': build_time, 'logical': _resources(oracle)}
+    if transpile:
+        start = time.perf_counter()
+        transpiled = qCache.eagle_pass_manager().run(oracle)
+        record['transpile_time'] = time.perf_counter() - start
+        record['transpiled'] = _resources(transpiled)
+        start = time.perf_counter()
+        qTemplates.template_transpile(oracle)
+        record['template_transpile_time'] = time.perf_counter() - start
+        start = time.perf_counter()
+        optimized = qPeephole.peephole(oracle)
+        record['peephole_time'] = time.perf_counter() - start
+        record['peephole_removed'] = optimized.report.size_before - optimized.report.size_after
+        record['peephole_transpiled'] = _resources(qCache.eagle_pass_manager().run(optimized.circuit))
+    if nodes * colors <= max_simulated_qubits:
+        start = time.perf_counter()
+        res = qClassical.evaluate_oracle(oracle, nodes, colors, uncompute=uncompute)
+        record['simulate_time'] = time.perf_counter() - start
+        record['solutions'] = int(res.output.sum())
+        record['correct'] = bool(record['solutions'] == qSolutions.count_colorings(nodes, edges, colors, one_color)
+                                 and res.ancillas_clean.all())
+    return record
+
+
+def run_benchmarks(families=('path', 'cycle', 'grid', 'random'), sizes=(4, 6, 8), colors=(2, 3),
+                   constructions=tuple(CONSTRUCTIONS), max_simulated_qubits=20, transpile=True, include_paper=True):
+    ''' Runs every combination and returns the JSON-serializable report '''
+    graphs = [(family, n, FAMILIES[family](n)) for family in families for n in sizes]
+    if include_paper:
+        graphs.append(('paper', 6, PAPER_EDGES))
+    records = []
+    for family, n, edges in graphs:
+        for c in colors:
+            for construction in constructions:
+                record = bench_one(construction, n, edges, c, max_simulated_qubits, transpile)
+                if record is not None:
+                    record['family'] = family
+                    records.append(record)
+    return {'metadata': _metadata(), 'records': records}
+
+
+def _metadata():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {'revision': revision, 'qiskit': qiskit.__version__, 'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def _key(record):
+    return (record['family'], record['nodes'], record['colors'], record['construction'])
+
+
+def compare(old_report, new_report, metrics=('logical.depth', 'logical.two_qubit_gates', 'transpiled.depth',
+                                              'transpiled.two_qubit_gates', 'build_time', 'transpile_time',
+                                              'template_transpile_time', 'peephole_transpiled.two_qubit_gates'),
+            tolerance=0.10):
+    ''' Regressions of 'new_report' against 'old_report': list of (key, metric, old, new) where new > old*(1+tolerance) '''
+    def get(record, metric):
+        value = record
+        for part in metric.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+    old = {_key(r): r for r in old_report['records']}
+    regressions = []
+    for record in new_report['records']:
+        previous = old.get(_key(record))
+        if previous is None:
+            continue
+        for metric in metrics:
+            a, b = get(previous, metric), get(record, metric)
+            if a is not None and b is not None and b > a * (1 + tolerance):
+                regressions.append((_key(record), metric, a, b))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default='bench_output.json')
+    parser.add_argument('--families', nargs='+', default=['path', 'cycle', 'grid', 'random'], choices=sorted(FAMILIES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[4, 6, 8])
+    parser.add_argument('--colors', nargs='+', type=int, default=[2, 3])
+    parser.add_argument('--constructions', nargs='+', default=list(CONSTRUCTIONS), choices=list(CONSTRUCTIONS))
+    parser.add_argument('--max-simulated-qubits', type=int, default=20)
+    parser.add_argument('--no-transpile', action='store_true')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            regressions = compare(json.load(f_old), json.load(f_new), tolerance=args.tolerance)
+        for key, metric, a, b in regressions:
+            print(f"{key}: {metric} {a} -> {b}")
+        return 1 if regressions else 0
+
+    report = run_benchmarks(args.families, args.sizes, args.colors, args.constructions, args.max_simulated_qubits,
+                            not args.no_transpile)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    for r in report['records']:
+        resources = r.get('transpiled', r['logical'])
+        print(f"{r['family']:>6} n={r['nodes']:<3} c={r['colors']} {r['construction']:<22} qubits={r['logical']['qubits']:<4} "
+              f"depth={resources['depth']:<6} 2q={resources['two_qubit_gates']:<6} build={r['build_time']:.3f}s "
+              f"correct={r.get('correct')}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
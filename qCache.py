@@ -0,0 +1,167 @@
+"""
+Content-addressed cache of built and transpiled oracles.
+
+Entries are keyed by (builder function, number of nodes, canonical edge set, colors, use_extendedEdges) for the logical
+circuit, plus the basis gates for the transpiled one. They are kept in memory with LRU eviction and, if a directory is
+given, on disk in QPY format under the SHA-256 of the key, so parameter sweeps and later sessions reuse them.
+The key holds the builder's source code and the sources of the modules it builds with ('gatesUPCT', 'quantum_f',
+'qCounters' and the builder's own module), plus 'CACHE_VERSION', so editing a builder or a helper it calls invalidates
+its entries.
+
+    >>> cache = qCache.OracleCache(directory='oracle_cache')
+    >>> oracle = cache.get_oracle(gatesUPCT.oracle_creator, nodes, edges, colors)
+    >>> transpiled = cache.get_transpiled(gatesUPCT.oracle_creator, nodes, edges, colors, basis_gates=qCache.EAGLE_BASIS)
+
+Circuits are returned as copies, so composing into them in place (as the notebooks do) does not alter the cache.
+The edges are canonicalized (each pair sorted, duplicates removed, list sorted) before building, so two edge lists
+describing the same graph share an entry.
+"""
+import collections
+import functools
+import hashlib
+import importlib.util
+import inspect
+import os
+
+import qiskit
+import qiskit.qpy
+
+EAGLE_BASIS = ('sx', 'x', 'rz', 'ecr') # IBM Eagle Quantum Processor native gates
+
+CACHE_VERSION = 1 # bump to drop the stored entries when something outside the hashed sources changes them
+HELPER_MODULES = ('gatesUPCT', 'quantum_f', 'qCounters') # modules whose helpers the builders call
+
+
+def eagle_pass_manager(basis_gates=EAGLE_BASIS, peephole=False):
+    ''' The PassManager used in the notebooks: UnrollCustomDefinitions + BasisTranslator to 'basis_gates';
+        with 'peephole' the circuit first goes through 'qPeephole.OraclePeephole' (barriers dropped) '''
+    library = qiskit.circuit.equivalence_library.SessionEquivalenceLibrary
+    pass_manager = qiskit.transpiler.PassManager()
+    if peephole:
+        import qPeephole
+        pass_manager.append(qPeephole.OraclePeephole())
+    pass_manager.append(qiskit.transpiler.passes.UnrollCustomDefinitions(library, list(basis_gates)))
+    pass_manager.append(qiskit.transpiler.passes.BasisTranslator(library, list(basis_gates)))
+    return pass_manager
+
+
+def canonical_edges(edges):
+    ''' Sorted tuple of sorted, unique node pairs '''
+    return tuple(sorted({tuple(sorted((int(a), int(b)))) for a, b in edges}))
+
+
+def call_builder(builder, nodes, edges, colors, use_extendedEdges=False):
+    ''' Calls any of the 'gatesUPCT' builders regardless of its argument order ('chromaticSpace' or 'colors') '''
+    values = {'nodes': nodes, 'edges': list(edges), 'colors': colors, 'chromaticSpace': colors,
+              'use_extendedEdges': use_extendedEdges}
+    params = inspect.signature(builder).parameters
+    return builder(**{name: values[name] for name in params if name in values})
+
+
+@functools.lru_cache(maxsize=None)
+def _modules_digest(modules):
+    # SHA-256 of the source files of 'modules' (read once per process)
+    digest = hashlib.sha256()
+    for name in modules:
+        spec = importlib.util.find_spec(name)
+        if spec is not None and spec.origin and os.path.exists(spec.origin):
+            with open(spec.origin, 'rb') as f:
+                digest.update(name.encode() + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+def _builder_id(builder):
+    try:
+        source = inspect.getsource(builder)
+    except (OSError, TypeError):
+        source = ''
+    modules = tuple(sorted(set(HELPER_MODULES) | {builder.__module__}))
+    digest = hashlib.sha256(f"{CACHE_VERSION}\0{_modules_digest(modules)}\0{source}".encode()).hexdigest()[:16]
+    return f"{builder.__module__}.{builder.__qualname__}:{digest}"
+
+
+def oracle_key(builder, nodes, edges, colors, use_extendedEdges=False, basis_gates=None):
+    ''' Cache key; 'basis_gates' None stands for the logical (untranspiled) circuit '''
+    basis = None if basis_gates is None else tuple(sorted(basis_gates))
+    return (_builder_id(builder), int(nodes), canonical_edges(edges), int(colors), bool(use_extendedEdges), basis)
+
+
+def key_digest(key):
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+class OracleCache:
+    """ LRU cache (in memory) plus optional QPY store (on disk) of logical and transpiled oracles """
+
+    def __init__(self, maxsize=64, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.__entries = collections.OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def clear(self):
+        self.__entries.clear()
+
+    def get_oracle(self, builder, nodes, edges, colors, use_extendedEdges=False):
+        ''' Logical circuit built by 'builder' for the graph '''
+        key = oracle_key(builder, nodes, edges, colors, use_extendedEdges)
+        return self.__get(key, lambda: call_builder(builder, nodes, canonical_edges(edges), colors, use_extendedEdges))
+
+    def get_transpiled(self, builder, nodes, edges, colors, use_extendedEdges=False, basis_gates=EAGLE_BASIS):
+        ''' Circuit built by 'builder' and translated to 'basis_gates' with 'eagle_pass_manager' '''
+        key = oracle_key(builder, nodes, edges, colors, use_extendedEdges, basis_gates)
+        build = lambda: eagle_pass_manager(basis_gates).run(self.get_oracle(builder, nodes, edges, colors, use_extendedEdges))
+        return self.__get(key, build)
+
+    def __get(self, key, build):
+        if key in self.__entries:
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return self.__entries[key].copy()
+        circuit = self.__load(key)
+        if circuit is None:
+            self.misses += 1
+            circuit = build()
+            self.__store(key, circuit)
+        else:
+            self.hits += 1
+        self.__entries[key] = circuit
+        while len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+        return circuit.copy()
+
+    def __path(self, key):
+        return os.path.join(self.directory, key_digest(key) + '.qpy')
+
+    def __load(self, key):
+        if self.directory is None or not os.path.exists(self.__path(key)):
+            return None
+        with open(self.__path(key), 'rb') as f:
+            return qiskit.qpy.load(f)[0]
+
+    def __store(self, key, circuit):
+        if self.directory is None:
+            return
+        tmp = self.__path(key) + '.tmp'
+        with open(tmp, 'wb') as f:
+            qiskit.qpy.dump(circuit, f)
+        os.replace(tmp, self.__path(key))
+
+
+default_cache = OracleCache()
+
+
+def cached_oracle(builder, nodes, edges, colors, use_extendedEdges=False):
+    ''' 'OracleCache.get_oracle' on the module-level cache '''
+    return default_cache.get_oracle(builder, nodes, edges, colors, use_extendedEdges)
+
+
+def cached_transpiled(builder, nodes, edges, colors, use_extendedEdges=False, basis_gates=EAGLE_BASIS):
+    ''' 'OracleCache.get_transpiled' on the module-level cache '''
+    return default_cache.get_transpiled(builder, nodes, edges, colors, use_extendedEdges, basis_gates)
@@ -0,0 +1,233 @@
+"""
+Vectorized classical evaluation of the reversible part of the coloring oracles.
+
+The circuits built by 'gatesUPCT.oracle_creator', 'oracle_creator_Grover' and 'oracle_creator_CdC_OH'
+only use X, CX, CCX and MCX gates before their final phase step, so on a basis input they behave as a
+classical reversible function. This module compiles such a circuit once into a flat list of bit operations
+and runs it over a whole batch of basis inputs at the same time: every qubit is a row of bits packed in
+uint64 words (64 inputs per word), and every gate becomes a couple of NumPy AND/XOR operations over the rows.
+
+    >>> oracle = gatesUPCT.oracle_creator(nodes, edges, colors)
+    >>> res = qClassical.evaluate_oracle(oracle, nodes, colors, uncompute=True)   # all 2^(nodes*colors) inputs
+    >>> res.output.sum(), res.ancillas_clean.all()
+"""
+import collections
+import math
+import numpy as np
+
+# Operations of the compiled program: ('x', controls, ctrl_values, target), ('phase', qubits, values, None)
+# and ('swap', (a, b), (), None). 'values' holds the control state (1 = control on |1>, 0 = control on |0>).
+_IGNORED_OPS = {'barrier', 'measure', 'delay', 'id', 'snapshot', 'save_statevector'}
+_PHASE_TOL = 1e-9
+
+CompiledCircuit = collections.namedtuple('CompiledCircuit', ['num_qubits', 'ops', 'prepared', 'stop_index', 'stop_op'])
+CompiledCircuit.__doc__ = """ Result of 'compile_circuit'. 'ops' is the flat list of classical operations, 'prepared' the qubits that
+    only received an initial H (state preparation, as in 'oracle_creator_CdC_OH'), 'stop_index'/'stop_op' the position and name of the
+    first non classical operation of the top-level circuit (None if the whole circuit is classical). """
+
+OracleEvaluation = collections.namedtuple('OracleEvaluation', ['inputs', 'output', 'ancillas_clean', 'inputs_restored', 'complete'])
+OracleEvaluation.__doc__ = """ Result of 'evaluate_oracle'. 'inputs' are the basis indexes of the search register, 'output' the oracle bit
+    for each one, 'ancillas_clean' whether every qubit outside the search register (and the output qubit) ended at 0,
+    'inputs_restored' whether the search register was left unchanged, and 'complete' whether the whole circuit was classical. """
+
+
+def _is_pi(value):
+    try:
+        return math.isclose(float(value) % (2 * math.pi), math.pi, abs_tol=_PHASE_TOL)
+    except TypeError:
+        return False
+
+
+def _ctrl_values(op):
+    n = op.num_ctrl_qubits
+    return tuple((op.ctrl_state >> i) & 1 for i in range(n))
+
+
+def _classify(op, qubits):
+    ''' Returns the list of compiled operations equivalent to 'op' acting on 'qubits', or None if 'op' is not classical '''
+    name = op.name
+    if name in _IGNORED_OPS:
+        return []
+    if name == 'x':
+        return [('x', (), (), qubits[0])]
+    if name == 'swap':
+        return [('swap', (qubits[0], qubits[1]), (), None)]
+    if name == 'z':
+        return [('phase', (qubits[0],), (1,), None)]
+    if name == 'p' and _is_pi(op.params[0]):
+        return [('phase', (qubits[0],), (1,), None)]
+    base = getattr(op, 'base_gate', None)
+    if base is not None and hasattr(op, 'num_ctrl_qubits'):
+        n = op.num_ctrl_qubits
+        controls, values = tuple(qubits[:n]), _ctrl_values(op)
+        if base.name == 'x':
+            # extra qubits (mcx_vchain, mcx_recursive) are ancillas the gate restores
+            return [('x', controls, values, qubits[n])]
+        if base.name == 'z' or (base.name == 'p' and _is_pi(base.params[0])):
+            return [('phase', controls + (qubits[n],), values + (1,), None)]
+    return None
+
+
+def compile_circuit(qc, allow_preparation=True):
+    ''' Compiles the classical reversible prefix of 'qc' into a 'CompiledCircuit'.
+        Custom gates (for instance the ones created with 'to_gate()') are expanded through their definition. H gates on qubits
+        that have not been touched yet are taken as state preparation when 'allow_preparation' is True; any other non classical
+        operation stops the compilation, which is reported in 'stop_index'/'stop_op'.
+    '''
+    prepared = set()
+    touched = set()
+
+    def expand(circuit, qmap, ops, top_level):
+        # returns the name of the first non classical operation (and its position at the top level), or None
+        for pos, inst in enumerate(circuit.data):
+            qubits = tuple(qmap[circuit.find_bit(q).index] for q in inst.qubits)
+            op = inst.operation
+            compiled = _classify(op, qubits)
+            if compiled is None and op.name == 'h':
+                if allow_preparation and top_level and qubits[0] not in touched:
+                    prepared.add(qubits[0])
+                    continue
+            elif compiled is None and getattr(op, 'definition', None) is not None:
+                sub_ops = []
+                if expand(op.definition, qubits, sub_ops, False) is None:
+                    compiled = sub_ops
+            if compiled is None:
+                return (pos, op.name) if top_level else op.name
+            for _, controls, _, target in compiled:
+                touched.update(controls)
+                if target is not None:
+                    touched.add(target)
+            ops.extend(compiled)
+        return None
+
+    ops = []
+    stop = expand(qc, tuple(range(qc.num_qubits)), ops, True)
+    stop_index, stop_op = stop if stop is not None else (None, None)
+    return CompiledCircuit(qc.num_qubits, ops, sorted(prepared), stop_index, stop_op)
+
+
+def pack_rows(bits):
+    ''' Packs a (rows, batch) boolean array into a (rows, ceil(batch/64)) uint64 array (bit i of the batch in word i//64) '''
+    bits = np.asarray(bits, dtype=bool)
+    packed = np.packbits(bits, axis=1, bitorder='little')
+    pad = (-packed.shape[1]) % 8
+    if pad:
+        packed = np.pad(packed, ((0, 0), (0, pad)))
+    return np.ascontiguousarray(packed).view('<u8')
+
+
+def unpack_rows(words, batch):
+    ''' Inverse of 'pack_rows' '''
+    words = np.ascontiguousarray(words, dtype='<u8')
+    return np.unpackbits(words.view(np.uint8), axis=1, bitorder='little', count=batch).astype(bool)
+
+
+def index_rows(indexes, width):
+    ''' Bit rows (width, batch) of the basis indexes 'indexes': row j holds bit j of every index '''
+    indexes = np.asarray(indexes, dtype=np.uint64)
+    shifts = np.arange(width, dtype=np.uint64)[:, None]
+    return ((indexes[None, :] >> shifts) & np.uint64(1)).astype(bool)
+
+
+def run_packed(compiled, state, reverse=False):
+    ''' Applies the compiled operations to 'state' (num_qubits, words) in place and returns the packed phase-flip row '''
+    ones = np.uint64(0xFFFFFFFFFFFFFFFF)
+    flip = np.zeros(state.shape[1], dtype=np.uint64)
+    ops = reversed(compiled.ops) if reverse else compiled.ops
+    for kind, qubits, values, target in ops:
+        if kind == 'swap':
+            a, b = qubits
+            state[[a, b]] = state[[b, a]]
+            continue
+        if qubits:
+            cond = state[qubits[0]] if values[0] else ~state[qubits[0]]
+            for q, v in zip(qubits[1:], values[1:]):
+                cond = cond & (state[q] if v else ~state[q])
+        else:
+            cond = ones
+        if kind == 'x':
+            state[target] ^= cond
+        else:
+            flip ^= cond
+    return flip
+
+
+def evaluate_circuit(qc, input_qubits, inputs=None, compiled=None, uncompute=False):
+    ''' Evaluates the classical part of 'qc' on a batch of basis inputs.
+        'inputs' can be None (every basis state of 'input_qubits'), an array of integer basis indexes (bit j <-> input_qubits[j])
+        or a (batch, len(input_qubits)) boolean array. Every other qubit starts at 0. If 'uncompute' is True, the classical
+        operations are replayed in reverse order afterwards, as the 'reverse_ops()' used in the notebooks would do.
+        Returns (final bits as a (num_qubits, batch) boolean array, phase flip per input, compiled circuit).
+    '''
+    compiled = compile_circuit(qc) if compiled is None else compiled
+    bits, flip = _run_rows(compiled, input_qubits, _input_rows(input_qubits, inputs), uncompute)
+    return bits, flip, compiled
+
+
+def _run_rows(compiled, input_qubits, rows, uncompute):
+    batch = rows.shape[1]
+    state = np.zeros((compiled.num_qubits, (batch + 63) // 64), dtype=np.uint64)
+    state[list(input_qubits)] = pack_rows(rows)
+    flip = run_packed(compiled, state)
+    if uncompute:
+        run_packed(compiled, state, reverse=True)
+    return unpack_rows(state, batch), unpack_rows(flip[None, :], batch)[0]
+
+
+def _input_rows(input_qubits, inputs):
+    width = len(input_qubits)
+    if inputs is None:
+        if width > 30:
+            raise ValueError(f"Enumerating 2^{width} inputs is not possible, pass explicit 'inputs'")
+        inputs = np.arange(2 ** width, dtype=np.uint64)
+    inputs = np.asarray(inputs)
+    if inputs.ndim == 2:
+        if inputs.shape[1] != width:
+            raise ValueError(f"Expected {width} bits per input, got {inputs.shape[1]}")
+        return inputs.astype(bool).T
+    return index_rows(inputs, width)
+
+
+def evaluate_oracle(oracle, nodes, colors, inputs=None, output_qubit=-1, uncompute=False, chunk_size=1 << 20):
+    ''' Evaluates a coloring oracle on a batch of search-register inputs (the first nodes*colors qubits).
+        The output bit is the phase flip of the final phase step when the circuit has one (oracle_creator, oracle_creator_CdC_OH)
+        and the value of 'output_qubit' otherwise (oracle_creator_Grover, whose evaluation stops at the diffuser).
+        Use 'uncompute=True' for oracles that do not undo their ancillas themselves ('oracle_creator' and 'oracle_creator_CdC_OH');
+        without it their ancillas are reported as dirty.
+        Inputs are processed in chunks of 'chunk_size' to bound memory; see 'evaluate_circuit' for the accepted 'inputs'.
+    '''
+    width = nodes * colors
+    compiled = compile_circuit(oracle)
+    has_phase = any(op[0] == 'phase' for op in compiled.ops)
+    if inputs is None:
+        if width > 40:
+            raise ValueError(f"Enumerating 2^{width} inputs is not possible, pass explicit 'inputs'")
+        inputs = np.arange(2 ** width, dtype=np.uint64)
+    inputs = np.asarray(inputs)
+    search = list(range(width))
+    out_q = output_qubit % oracle.num_qubits
+    others = [q for q in range(oracle.num_qubits) if q >= width and (has_phase or q != out_q)]
+
+    outputs, clean, restored = [], [], []
+    for start in range(0, len(inputs), chunk_size):
+        chunk = inputs[start:start + chunk_size]
+        rows = _input_rows(search, chunk)
+        bits, flip = _run_rows(compiled, search, rows, uncompute)
+        outputs.append(flip if has_phase else bits[out_q])
+        clean.append(~bits[others].any(axis=0) if others else np.ones(bits.shape[1], dtype=bool))
+        restored.append((bits[:width] == rows).all(axis=0))
+
+    if inputs.ndim == 1:
+        idx = inputs.astype(np.uint64)
+    else:
+        idx = None
+    cat = lambda parts: np.concatenate(parts) if parts else np.zeros(0, dtype=bool)
+    return OracleEvaluation(idx, cat(outputs), cat(clean), cat(restored), compiled.stop_index is None)
+
+
+def assignment_index(color_assignment, colors):
+    ''' Basis index of the search register for a one-hot 'color_assignment' (same layout as 'gatesUPCT.check_solution') '''
+    index = 0
+    for node, color in enumerate(color_assignment):
+        index |= 1 << (node * colors + color)
+    return index
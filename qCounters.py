@@ -21,6 +21,13 @@ class C_Ladder_Counter:
 
     Una vez creado el contador, se invoca el método 'next()' para que te retorne el siguiente trozo de contador, que incluye siempre todos los triggers. El siguiente código muestra cómo añadir directamente el trozo de contador generado al circuito. Por último, el trozo de contador generado por 'next()' satura cuando, o bien ya no hay más qbits disponibles en el contador (segundo parámetro del constructor), o bien ya se han recorrido todos los triggers (primer parámetro del constructor). A partir de este momento, retorna el circuito vacío. El método 'is_exhausted()' se puede utilizar para detectar esta condición, que se puede utilizar en un 'while'.
     >>> circuito.compose(cnt_qregisters.next(), inplace=True)
+
+    Para no copiar el circuito en cada paso, 'next()' acepta también el circuito destino y añade el trozo directamente
+    sobre él ('inplace'); 'emit_all()' añade de una vez todos los trozos que quedan y 'emit_inverse()' añade la parte de
+    'uncompute' (las mismas puertas en orden inverso) sin copiar ni invertir el circuito completo:
+    >>> cnt_qregisters.emit_all(circuito)
+    >>> cnt_qregisters.emit_inverse(circuito)
+    El estado del contador para cualquier 'init_value' se calcula en forma cerrada, sin iterar.
     """
 
     def __init__(self, matrix_trigger_qbits, counter_qbits, qc, init_value=0):
@@ -32,24 +39,49 @@ class C_Ladder_Counter:
         self.__is_exhausted = False # have all counter_qbits been generated for this counter?
         self.__n_available_cnt=2**len(counter_qbits)
         self.__column=0
-        self.__qc=qc.copy_empty_like()
+        self.__qc=qc
+        self.__emitted=[] # (controls, target) of every mcx emitted so far, for 'emit_inverse()'
         if init_value!=0 :
-            for _ in range(init_value):
-                self.__incr()
+            self.__set_count(init_value)
+
+    def __set_count(self, value):
+        # closed form of 'value' calls to '__incr()' from the initial state
+        self.__n_ccx=(value+1).bit_length()
+        self.__next_jump=2**(self.__n_ccx-1)
+        self.__current_pos=value+2-self.__next_jump
+        self.__n_available_cnt=2**len(self.__counters)-value
+        # '__incr()' marks the counter as exhausted when the available count reaches 1 at any of the 'value' steps
+        if 1<=2**len(self.__counters)-1<=value or len(self.__triggers[0])==0 :
+            self.__is_exhausted = True
 
-    def next(self):
-        tmp=self.__qc.copy_empty_like()
+    def next(self, qc=None):
+        """ Retorna el siguiente trozo de contador en un circuito nuevo o, si se le pasa 'qc', lo añade sobre 'qc' y lo retorna """
+        tmp=self.__qc.copy_empty_like() if qc is None else qc
         if self.__is_exhausted : 
             return tmp
         list_controls=[]
         for j in range(len(self.__triggers)):
             list_controls.append(self.__triggers[j][self.__column])
         for i in range(self.__n_ccx, 0, -1) :
-            tmp.mcx(control_qubits=list_controls+self.__counters[:i-1], target_qubit=self.__counters[i-1])
+            gate=(list_controls+list(self.__counters[:i-1]), self.__counters[i-1])
+            tmp.mcx(control_qubits=gate[0], target_qubit=gate[1])
+            self.__emitted.append(gate)
         self.__column+=1
         self.__incr()
         return tmp
 
+    def emit_all(self, qc):
+        """ Añade sobre 'qc' todos los trozos que quedan hasta agotar el contador """
+        while not self.__is_exhausted:
+            self.next(qc)
+        return qc
+
+    def emit_inverse(self, qc):
+        """ Añade sobre 'qc' el 'uncompute' de todo lo emitido por el contador (las mcx son su propia inversa) """
+        for controls, target in reversed(self.__emitted):
+            qc.mcx(control_qubits=controls, target_qubit=target)
+        return qc
+
     def __incr(self):
         self.__n_available_cnt-=1
         if self.__current_pos == self.__next_jump :
@@ -79,6 +111,9 @@ class C_Counter:
 
     Una vez creado el contador, se invoca el método 'next()' para que te retorne el siguiente trozo de contador, que incluye siempre todos los triggers. El siguiente código muestra cómo añadir directamente el trozo de contador generado al circuito. Por último, el trozo de contador generado por 'next()' satura cuando ya no hay más qbits disponibles en el contador (segundo parámetro del constructor) y, a partir de este momento, retorna siempre el mismo trozo de circuito. El método 'is_exhausted()' se puede utilizar para detectar esta condición, que se puede utilizar en un 'while'.
     >>> circuito.compose(cnt_qregisters.next(), inplace=True)
+
+    Igual que en 'C_Ladder_Counter', 'next(qc)' añade el trozo directamente sobre 'qc' sin copiar el circuito, y
+    'emit_inverse(qc)' añade el 'uncompute' de todo lo emitido.
     """
 
     def __init__(self, trigger_qbits, counter_qbits, qc):
@@ -89,16 +124,24 @@ class C_Counter:
         self.__counters=counter_qbits
         self.__is_exhausted = False # have all counter_qbits been generated for this counter?
         self.__n_available_cnt=2**len(counter_qbits)
-        self.__exhausted_qc=0
-        self.__qc=qc.copy_empty_like()
+        self.__exhausted_gates=[]
+        self.__qc=qc
+        self.__emitted=[] # (controls, target) of every mcx emitted so far, for 'emit_inverse()'
 
-    def next(self):
+    def next(self, qc=None):
+        """ Retorna el siguiente trozo de contador en un circuito nuevo o, si se le pasa 'qc', lo añade sobre 'qc' y lo retorna """
+        tmp=self.__qc.copy_empty_like() if qc is None else qc
         if self.__is_exhausted : 
-            return self.__exhausted_qc
-        tmp=self.__qc.copy_empty_like()
+            for controls, target in self.__exhausted_gates:
+                tmp.mcx(control_qubits=controls, target_qubit=target)
+            self.__emitted.extend(self.__exhausted_gates)
+            return tmp
+        gates=[]
         for i in range(self.__n_ccx, 0, -1) :
             list_controls=quantum_f.flatten_list([self.__triggers, self.__counters[:i-1]])
             tmp.mcx(control_qubits=list_controls, target_qubit=self.__counters[i-1])
+            gates.append((list_controls, self.__counters[i-1]))
+        self.__emitted.extend(gates)
         self.__n_available_cnt-=1
         if self.__current_pos == self.__next_jump :
             self.__current_pos = 1
@@ -108,8 +151,14 @@ class C_Counter:
             self.__current_pos += 1
         if self.__n_available_cnt==1 :
             self.__is_exhausted = True
-            self.__exhausted_qc = tmp
+            self.__exhausted_gates = gates
         return tmp
+
+    def emit_inverse(self, qc):
+        """ Añade sobre 'qc' el 'uncompute' de todo lo emitido por el contador (las mcx son su propia inversa) """
+        for controls, target in reversed(self.__emitted):
+            qc.mcx(control_qubits=controls, target_qubit=target)
+        return qc
     
     def is_exhausted (self):
         return self.__is_exhausted
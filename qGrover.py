@@ -0,0 +1,261 @@
+"""
+Ancilla-free simulation of Grover search over the one-hot search register of the coloring oracles.
+
+The ancillas of every oracle return to |0>, so during Grover search the state always lives in the 2^(nodes*colors)
+amplitudes of the search register. Here the oracle is a precomputed diagonal phase mask (True where the oracle flips
+the phase) and 'quantum_f.add_diffuser' (H X MCZ X H = I - 2|s><s|) is the reflection psi -> psi - 2*mean(psi).
+All amplitudes stay real, so one iteration costs a couple of NumPy passes over a float array.
+
+    >>> mask = qGrover.phase_mask(nodes, edges, colors, one_color=False)
+    >>> psi = qGrover.simulate_grover(mask, iterations=5)
+    >>> qGrover.success_probability(psi, mask)
+"""
+import collections
+import math
+import numpy as np
+import qiskit
+
+import qClassical
+import qSolutions
+
+
+def phase_mask(nodes, edges, colors, one_color=True, chunk_size=1 << 22):
+    ''' Boolean phase mask of the search register computed from the graph (see 'qSolutions.valid_indexes_mask') '''
+    size = 2 ** (nodes * colors)
+    mask = np.empty(size, dtype=bool)
+    for start in range(0, size, chunk_size):
+        chunk = np.arange(start, min(start + chunk_size, size), dtype=np.uint64)
+        mask[start:start + len(chunk)] = qSolutions.valid_indexes_mask(nodes, edges, colors, chunk, one_color)
+    return mask
+
+
+def phase_mask_from_oracle(oracle, nodes, colors, uncompute=False, chunk_size=1 << 20):
+    ''' Boolean phase mask of the search register taken from an oracle circuit with the classical engine of 'qClassical' '''
+    res = qClassical.evaluate_oracle(oracle, nodes, colors, uncompute=uncompute, chunk_size=chunk_size)
+    if not res.ancillas_clean.all():
+        raise ValueError("The oracle leaves dirty ancillas, the search register alone does not describe its action "
+                         "(try 'uncompute=True')")
+    return res.output
+
+
+def uniform_state(num_qubits, dtype=np.float64):
+    ''' Amplitudes of H^n|0> '''
+    size = 2 ** num_qubits
+    return np.full(size, 1 / np.sqrt(size), dtype=dtype)
+
+
+def apply_oracle(psi, mask):
+    ''' Phase flip of the marked amplitudes, in place '''
+    np.negative(psi, out=psi, where=mask)
+    return psi
+
+
+def apply_diffuser(psi):
+    ''' Reflection of 'quantum_f.add_diffuser' (I - 2|s><s|), in place '''
+    psi -= 2 * psi.mean()
+    return psi
+
+
+def simulate_grover(mask, iterations, psi=None, dtype=np.float64):
+    ''' Amplitudes of the search register after 'iterations' Grover iterations (oracle + diffuser) starting from
+        the uniform superposition, or from 'psi' if given. Index i of the result is the basis state of qiskit's ordering
+        (bit j of i <-> qubit j), so the result can be wrapped with 'qiskit.quantum_info.Statevector'.
+    '''
+    mask = np.asarray(mask, dtype=bool)
+    num_qubits = int(len(mask)).bit_length() - 1
+    psi = uniform_state(num_qubits, dtype) if psi is None else np.array(psi, copy=True)
+    for _ in range(iterations):
+        apply_oracle(psi, mask)
+        apply_diffuser(psi)
+    return psi
+
+
+def success_probability(psi, mask):
+    ''' Probability of measuring a marked state '''
+    return float(np.sum(np.abs(psi[np.asarray(mask, dtype=bool)]) ** 2))
+
+
+def sweep_iterations(mask, max_iterations, dtype=np.float64):
+    ''' Success probability after 0, 1, ..., 'max_iterations' iterations, reusing the state between steps '''
+    mask = np.asarray(mask, dtype=bool)
+    psi = uniform_state(int(len(mask)).bit_length() - 1, dtype)
+    probs = [success_probability(psi, mask)]
+    for _ in range(max_iterations):
+        apply_diffuser(apply_oracle(psi, mask))
+        probs.append(success_probability(psi, mask))
+    return np.array(probs)
+
+
+# Iteration planning
+
+GroverPlan = collections.namedtuple('GroverPlan', ['search_qubits', 'solutions', 'iterations', 'success_probability'])
+GroverPlan.__doc__ = """ Result of 'plan_iterations': number of Grover iterations for the search register and its success probability """
+
+
+def rotation_angle(search_qubits, solutions):
+    ''' theta with sin^2(theta) = solutions / 2^search_qubits '''
+    return math.asin(math.sqrt(min(solutions / 2 ** search_qubits, 1.0)))
+
+
+def success_after(iterations, search_qubits, solutions):
+    ''' Probability of measuring a solution after 'iterations' Grover iterations: sin^2((2k+1)theta) '''
+    return math.sin((2 * iterations + 1) * rotation_angle(search_qubits, solutions)) ** 2
+
+
+def optimal_iterations(search_qubits, solutions):
+    ''' Number of iterations that maximizes 'success_after' for a search register of 'search_qubits' qubits (not the
+        total width of the oracle, which includes the ancillas). Returns 0 when there is nothing to amplify.
+    '''
+    if solutions <= 0 or solutions >= 2 ** search_qubits:
+        return 0
+    theta = rotation_angle(search_qubits, solutions)
+    k = max(0, math.floor(math.pi / (4 * theta) - 0.5))
+    # the closest integer to the peak can be either side of it
+    return max((k, k + 1), key=lambda i: success_after(i, search_qubits, solutions))
+
+
+def plan_iterations(nodes, edges, colors, one_color=True, solutions=None):
+    ''' Grover plan for the one-hot register of a coloring problem. The number of solutions is counted exactly with
+        'qSolutions.count_colorings' unless given (for instance estimated with 'gatesUPCT.quantum_counting').
+    '''
+    n = nodes * colors
+    if solutions is None:
+        solutions = qSolutions.count_colorings(nodes, edges, colors, one_color)
+    k = optimal_iterations(n, solutions)
+    return GroverPlan(n, solutions, k, success_after(k, n, solutions) if solutions else 0.0)
+
+
+def incremental_schedule(search_qubits, growth=6 / 5, seed=None):
+    ''' Iteration counts for an unknown number of solutions (Boyer, Brassard, Hoyer and Tapp): each attempt picks k uniformly
+        in [0, limit) and the limit grows by 'growth' up to sqrt(2^n). Expected total O(sqrt(N/m)) iterations.
+    '''
+    rng = np.random.default_rng(seed)
+    limit = 1.0
+    top = math.sqrt(2 ** search_qubits)
+    while True:
+        yield int(rng.integers(0, max(1, math.ceil(limit))))
+        limit = min(growth * limit, top)
+
+
+def search_unknown(mask, is_solution=None, max_attempts=64, seed=None):
+    ''' Runs the 'incremental_schedule' with the ancilla-free simulator: after each attempt one basis state is sampled and
+        checked classically with 'is_solution' (by default, the mask itself). Returns (index found or None, total iterations).
+    '''
+    mask = np.asarray(mask, dtype=bool)
+    n = int(len(mask)).bit_length() - 1
+    rng = np.random.default_rng(seed)
+    check = is_solution if is_solution is not None else (lambda index: bool(mask[index]))
+    total = 0
+    for attempt, k in enumerate(incremental_schedule(n, seed=rng)):
+        if attempt == max_attempts:
+            break
+        probs = np.abs(simulate_grover(mask, k)) ** 2
+        index = int(rng.choice(len(probs), p=probs / probs.sum()))
+        total += k
+        if check(index):
+            return index, total
+    return None, total
+
+
+# Circuit assembly
+
+class GroverAssembly:
+    """ Grover circuit described as preparation + 'iterations' copies of one iteration block (oracle, uncompute and diffuser).
+
+    The block is stored once and can be emitted in three ways:
+        block_circuit()  -> the block converted once to a Gate and appended 'iterations' times (shared definition)
+        flat_circuit()   -> every gate of every iteration, as 'circuito.compose(oracle, inplace=True)' in a loop would give
+        instructions()   -> lazy generator over the flattened instructions, without building the circuit
+    'transpile(pass_manager)' translates the preparation and the block once and returns a new assembly, so a transpiled
+    circuit of k iterations costs one block translation; 'statevector()' evolves the state block by block.
+
+        >>> assembly = qGrover.GroverAssembly(iteration, range(nodes * colors), 58)
+        >>> transpiled = assembly.transpile(qCache.eagle_pass_manager()).flat_circuit()
+    """
+
+    def __init__(self, iteration, search_qubits, iterations, preparation=None, measure=False):
+        self.iteration = iteration
+        self.search_qubits = list(search_qubits)
+        self.iterations = iterations
+        self.measure = measure
+        if preparation is None:
+            preparation = qiskit.QuantumCircuit(iteration.num_qubits)
+            preparation.h(self.search_qubits)
+        self.preparation = preparation
+        self.__gate = None
+
+    @property
+    def num_qubits(self):
+        return self.iteration.num_qubits
+
+    def _empty(self):
+        qc = self.iteration.copy_empty_like()
+        if self.measure and qc.num_clbits < len(self.search_qubits):
+            qc.add_register(qiskit.ClassicalRegister(len(self.search_qubits) - qc.num_clbits, 'meas'))
+        return qc
+
+    def _finish(self, qc):
+        if self.measure:
+            qc.measure(self.search_qubits, range(len(self.search_qubits)))
+        return qc
+
+    def block_gate(self):
+        if self.__gate is None:
+            self.__gate = _quantum_part(self.iteration).to_gate(label='grover_it')
+        return self.__gate
+
+    def block_circuit(self):
+        qc = self._empty()
+        qc.compose(self.preparation, qubits=range(self.num_qubits), inplace=True)
+        gate = self.block_gate()
+        qubits = list(range(self.num_qubits))
+        for _ in range(self.iterations):
+            qc.append(gate, qubits)
+        return self._finish(qc)
+
+    def instructions(self):
+        ''' Lazily expanded instructions of the flat circuit (Qubit objects belong to the iteration circuit) '''
+        prep_map = dict(zip(self.preparation.qubits, self.iteration.qubits))
+        for inst in self.preparation.data:
+            yield inst.replace(qubits=tuple(prep_map[q] for q in inst.qubits))
+        for _ in range(self.iterations):
+            yield from self.iteration.data
+
+    def flat_circuit(self):
+        qc = self._empty()
+        for inst in self.instructions():
+            qc._append(inst)
+        return self._finish(qc)
+
+    def transpile(self, pass_manager):
+        ''' New assembly with the preparation and the block translated once by 'pass_manager' '''
+        iteration = pass_manager.run(self.iteration)
+        preparation = pass_manager.run(self.preparation)
+        return GroverAssembly(iteration, self.search_qubits, self.iterations, preparation, self.measure)
+
+    def statevector(self, iterations=None):
+        ''' Statevector after the preparation and 'iterations' blocks (all of them by default), evolving block by block '''
+        from qiskit.quantum_info import Statevector
+        state = Statevector.from_label('0' * self.num_qubits).evolve(_quantum_part(self.preparation))
+        block = _quantum_part(self.iteration)
+        for _ in range(self.iterations if iterations is None else iterations):
+            state = state.evolve(block)
+        return state
+
+    def resources(self):
+        ''' Size and depth of the flat circuit computed from the block, without building it '''
+        block_size = self.iteration.size()
+        prep_size = self.preparation.size()
+        return {'qubits': self.num_qubits, 'iterations': self.iterations, 'block_size': block_size,
+                'size': prep_size + self.iterations * block_size,
+                'depth_upper_bound': self.preparation.depth() + self.iterations * self.iteration.depth()}
+
+
+def _quantum_part(qc):
+    # the circuit without measurements, barriers and classical bits, as 'Statevector.evolve' needs
+    bare = qiskit.QuantumCircuit(qc.num_qubits)
+    for inst in qc.data:
+        if inst.operation.name in ('barrier', 'measure'):
+            continue
+        bare.append(inst.operation, [qc.find_bit(q).index for q in inst.qubits])
+    return bare
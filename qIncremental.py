@@ -0,0 +1,264 @@
+"""
+Incremental update of the 'oracle_creator' oracles when a few edges of the graph change.
+
+'IncrementalOracle' keeps the oracle as segments: one per node (first color constraint, it never changes), one per slot
+of checked pair (the CCX and X of every color on the 'colors' ancillas of the slot) and the final part (the MCX over
+all the clause ancillas and the phase, or the uncompute and the diffuser of 'oracle_creator_Grover'). Adding or
+removing an edge only rebuilds the slots of the pairs that change:
+    - a removed pair leaves a hole: its segment becomes an X on each ancilla of the slot (the clause always holds), so
+      the final MCX, which covers every slot, does not change;
+    - an added pair takes the first hole, or a new slot at the end (the register grows by 'colors' ancillas and the
+      final part is rebuilt); 'spare_slots' reserves holes from the start, so insertions do not change the width.
+With 'use_extendedEdges' the pairs at distance two are updated from the neighbourhoods of the two ends of the edge.
+The translated form of every segment is kept until the segment changes ('qTemplates.TemplateTranspiler' underneath,
+so a new pair segment reuses the translation of the others), so the work of an update is proportional to the size
+of the change; only the final concatenation of 'transpiled()' walks the whole circuit.
+
+    >>> oracle = qIncremental.IncrementalOracle(nodes, edges, colors)      # circuit() == gatesUPCT.oracle_creator(...)
+    >>> oracle.update(added=[(0, 5)], removed=[(1, 2)])
+    >>> oracle.circuit(), oracle.transpiled()
+
+Without changes (and without spare slots) the circuit is the one of 'oracle_creator' ('grover' False) or
+'oracle_creator_Grover' ('grover' True).
+"""
+import collections
+import heapq
+
+import qiskit
+
+import gatesUPCT
+import qCache
+import qTemplates
+
+OracleUpdate = collections.namedtuple('OracleUpdate', ['added', 'removed', 'segments', 'width_changed'])
+OracleUpdate.__doc__ = """ Result of 'IncrementalOracle.update': checked pairs added and removed, segments rebuilt and
+    whether the register grew (then the final part was rebuilt too) """
+
+
+def _pair(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+def _op_qubits(op):
+    # qubits of a gate of 'gatesUPCT._constraint_blocks'
+    if op[0] == 'mcx':
+        return op[1] + (op[2],)
+    return op[1:]
+
+
+def _relabel(op, local):
+    if op[0] == 'mcx':
+        return ('mcx', tuple(local[q] for q in op[1]), local[op[2]])
+    return (op[0],) + tuple(local[q] for q in op[1:])
+
+
+class IncrementalOracle:
+    """ Oracle of 'gatesUPCT.oracle_creator' as node and pair segments that edge insertions and deletions patch in place """
+
+    def __init__(self, nodes, edges, colors, use_extendedEdges=False, grover=False, barriers=None, spare_slots=0,
+                 basis_gates=qCache.EAGLE_BASIS):
+        self.nodes = nodes
+        self.colors = colors
+        self.use_extendedEdges = use_extendedEdges
+        self.grover = grover
+        self.barriers = not grover if barriers is None else barriers
+        self.translator = qTemplates.TemplateTranspiler(basis_gates)
+        self.neighbors = [set() for _ in range(nodes)]
+        for a, b in edges:
+            self.neighbors[a].add(b)
+            self.neighbors[b].add(a)
+        checked = gatesUPCT.get_extended_edges(nodes, edges) if use_extendedEdges else list(edges)
+        self.slots = []                  # oriented pair checked in every slot, None for a hole
+        self.slot_of = {}                # canonical pair -> slot
+        self.holes = []                  # heap of free slots
+        for a, b in checked:
+            if _pair(a, b) not in self.slot_of:
+                self.slot_of[_pair(a, b)] = len(self.slots)
+                self.slots.append((a, b))
+        for _ in range(spare_slots):
+            heapq.heappush(self.holes, len(self.slots))
+            self.slots.append(None)
+        self.segments = {}
+        self.translated = {}
+        self.final_translated = self.diffuser_translated = None
+        for node in range(nodes):
+            self.segments[('node', node)] = self._node_ops(node)
+        for slot in range(len(self.slots)):
+            self.segments[('slot', slot)] = self._slot_ops(slot)
+        self.rebuilt = 0
+
+    # layout
+
+    @property
+    def search_qubits(self):
+        return self.nodes * self.colors
+
+    @property
+    def num_qubits(self):
+        return self.search_qubits + self.nodes + len(self.slots) * self.colors + 1
+
+    def _slot_ancilla(self, slot):
+        return self.search_qubits + self.nodes + slot * self.colors
+
+    def _node_ops(self, node):
+        group = list(range(node * self.colors, (node + 1) * self.colors))
+        return gatesUPCT._constraint_blocks([group], [], self.search_qubits + node, 0)
+
+    def _slot_ops(self, slot):
+        pair = self.slots[slot]
+        first = self._slot_ancilla(slot)
+        if pair is None:
+            ops = []
+            for ancilla in range(first, first + self.colors):
+                ops += [('x', ancilla), ('barrier',)]
+            return ops
+        a, b = pair
+        expanded = [(a * self.colors + i, b * self.colors + i) for i in range(self.colors)]
+        return gatesUPCT._constraint_blocks([], expanded, 0, first)
+
+    # graph changes
+
+    @property
+    def edges(self):
+        return sorted({_pair(a, b) for a in range(self.nodes) for b in self.neighbors[a]})
+
+    @property
+    def checked_pairs(self):
+        return [pair for pair in self.slots if pair is not None]
+
+    def _checked(self, a, b):
+        return b in self.neighbors[a] or (self.use_extendedEdges and not self.neighbors[a].isdisjoint(self.neighbors[b]))
+
+    def _candidates(self, u, v):
+        # pairs whose checked state can change with the edge (u, v): the edge and, at distance two, the pairs through u or v
+        pairs = {_pair(u, v)}
+        if self.use_extendedEdges:
+            for middle, other in ((u, v), (v, u)):
+                around = self.neighbors[middle] | {other}
+                pairs.update(_pair(x, y) for x in around for y in around if x != y)
+        return pairs
+
+    def update(self, added=(), removed=()):
+        ''' Applies edge insertions and deletions and rebuilds only the segments they change; returns an 'OracleUpdate' '''
+        candidates = set()
+        for u, v in list(removed) + list(added):
+            candidates |= self._candidates(u, v)
+        for u, v in removed:
+            self.neighbors[u].discard(v)
+            self.neighbors[v].discard(u)
+        for u, v in added:
+            self.neighbors[u].add(v)
+            self.neighbors[v].add(u)
+        for u, v in list(added):
+            candidates |= self._candidates(u, v)
+
+        gone = sorted(pair for pair in candidates if pair in self.slot_of and not self._checked(*pair))
+        new = sorted(pair for pair in candidates if pair not in self.slot_of and self._checked(*pair))
+        changed = []
+        for pair in gone:
+            slot = self.slot_of.pop(pair)
+            self.slots[slot] = None
+            heapq.heappush(self.holes, slot)
+            changed.append(slot)
+        width = len(self.slots)
+        for pair in new:
+            if self.holes:
+                slot = heapq.heappop(self.holes)
+                self.slots[slot] = pair
+            else:
+                slot = len(self.slots)
+                self.slots.append(pair)
+            self.slot_of[pair] = slot
+            changed.append(slot)
+        for slot in set(changed):
+            self.segments[('slot', slot)] = self._slot_ops(slot)
+            self.translated.pop(('slot', slot), None)
+        self.rebuilt += len(set(changed))
+        return OracleUpdate(new, gone, len(set(changed)), len(self.slots) != width)
+
+    def add_edge(self, u, v):
+        return self.update(added=[(u, v)])
+
+    def remove_edge(self, u, v):
+        return self.update(removed=[(u, v)])
+
+    # circuits
+
+    def _segment_ids(self):
+        return [('node', node) for node in range(self.nodes)] + [('slot', slot) for slot in range(len(self.slots))]
+
+    def _final(self, barriers):
+        # final MCX and phase (or Grover's diffuser; the uncompute is added by the callers) on the whole register
+        n = self.num_qubits
+        final = qiskit.QuantumCircuit(n)
+        final.mcx(list(range(self.search_qubits, n - 1)), n - 1)
+        if not self.grover:
+            if barriers:
+                final.barrier()
+            final.z(n - 1)
+        return final
+
+    def _diffuser(self):
+        # on the search register only, so it does not change with the graph
+        qubits = self.search_qubits
+        diffuser = qiskit.QuantumCircuit(qubits)
+        diffuser.h(range(qubits))
+        diffuser.x(range(qubits))
+        diffuser.h(qubits - 1)
+        diffuser.mcx(list(range(qubits - 1)), qubits - 1)
+        diffuser.h(qubits - 1)
+        diffuser.x(range(qubits))
+        diffuser.h(range(qubits))
+        return diffuser
+
+    def _empty(self):
+        return qiskit.QuantumCircuit(self.num_qubits) if self.grover else qiskit.QuantumCircuit(self.num_qubits, 1)
+
+    def circuit(self):
+        ''' Logical circuit of the current graph, assembled from the segments '''
+        ops = [op for segment in self._segment_ids() for op in self.segments[segment]]
+        if not self.grover:
+            ops = [('barrier',)] + ops
+        circuit = self._empty()
+        gatesUPCT._append_gate_list(circuit, ops, self.barriers)
+        circuit.compose(self._final(self.barriers), inplace=True, copy=False)
+        if self.grover:
+            gatesUPCT._append_gate_list(circuit, ops, False, reverse=True)
+            circuit.compose(self._diffuser(), range(self.search_qubits), inplace=True, copy=False)
+        return circuit
+
+    def _translated_segment(self, segment):
+        # (qubits of the segment, translated circuit on them, translated uncompute for Grover), kept until the segment changes
+        cached = self.translated.get(segment)
+        if cached is None:
+            ops = [op for op in self.segments[segment] if op[0] != 'barrier']
+            qubits = sorted({q for op in ops for q in _op_qubits(op)})
+            local = {q: i for i, q in enumerate(qubits)}
+            local_ops = [_relabel(op, local) for op in ops]
+            compute = qiskit.QuantumCircuit(len(qubits))
+            gatesUPCT._append_gate_list(compute, local_ops, False)
+            uncompute = None
+            if self.grover:
+                uncompute = qiskit.QuantumCircuit(len(qubits))
+                gatesUPCT._append_gate_list(uncompute, local_ops, False, reverse=True)
+                uncompute = self.translator.run(uncompute)
+            cached = self.translated[segment] = (qubits, self.translator.run(compute), uncompute)
+        return cached
+
+    def transpiled(self):
+        ''' Circuit translated to the basis of the translator, without barriers, from the translated segments (only the
+            segments that changed since the previous call are translated again) '''
+        out = self._empty()
+        segments = [self._translated_segment(segment) for segment in self._segment_ids()]
+        for qubits, translated, _ in segments:
+            out.compose(translated, qubits, inplace=True, copy=False)
+        if self.final_translated is None or self.final_translated.num_qubits != self.num_qubits:
+            self.final_translated = self.translator.run(self._final(False))
+        out.compose(self.final_translated, inplace=True, copy=False)
+        if self.grover:
+            for qubits, _, uncompute in reversed(segments):
+                out.compose(uncompute, qubits, inplace=True, copy=False)
+            if self.diffuser_translated is None:
+                self.diffuser_translated = self.translator.run(self._diffuser())
+            out.compose(self.diffuser_translated, range(self.search_qubits), inplace=True, copy=False)
+        return out
@@ -0,0 +1,329 @@
+"""
+Peephole optimization of the generated oracles, run before the basis translation.
+
+The builders emit redundant structure that the translation keeps and Grover multiplies by the number of iterations:
+the X layers of 'quantum_f.nor_gate'/'or_gate' around every MCX, the X of a clause ancilla next to the X of the
+following block, the 'oracle.x(...)' around the counter steps of 'qCounters', the barrier after every clause and the
+uncompute half that starts with the inverse of the last gates of the compute half. 'OraclePeephole' walks the circuit
+once and, for every new gate, looks back along its qubits (at most 'window' gates per qubit):
+    - X pairs: an X on q cancels the previous X on q if the gates in between use q as the target of an X (they commute)
+      or as a control, whose polarity is flipped (X . C_q(U) . X = C_q=0(U), 'polarity').
+    - inverse pairs: a self-inverse gate (X, CX, CCX, MCX, controlled Z, H, SWAP ...) cancels an equal gate on the same
+      qubits when every gate in between commutes with it (same role, control or X target, on every shared qubit).
+      Cancellations cascade, so a compute block followed by its mirror (the uncompute) disappears gate by gate.
+    - barriers: dropped ('drop'), kept as optimization boundaries ('keep') or kept with consecutive barriers merged
+      into one ('merge').
+With 'open_controls=False' (the default, for the translation to a basis without open controls) the flipped controls
+are lowered again to X gates and the X pairs that meet between neighbouring gates are cancelled, so a run of gates with
+the same flipped control keeps only the two X gates at its ends. With 'open_controls=True' the open controls stay (for
+the logical circuit, 'qClassical' and the simulators). The circuit keeps its unitary (and its action on the ancillas).
+
+    >>> result = qPeephole.peephole(oracle)
+    >>> result.report.size_before, result.report.size_after, result.report.removed
+    >>> pm = qCache.eagle_pass_manager(peephole=True)    # OraclePeephole before the translation
+
+The report of the last run of the pass is also stored in the PassManager's property set as 'peephole_report'.
+"""
+import collections
+
+import qiskit
+from qiskit.circuit import ControlledGate
+from qiskit.converters import circuit_to_dag, dag_to_circuit
+from qiskit.transpiler.basepasses import TransformationPass
+
+import qTemplates
+
+BARRIER_MODES = ('drop', 'merge', 'keep')
+
+_SELF_INVERSE = frozenset({'x', 'y', 'z', 'h', 'swap', 'cx', 'cy', 'cz', 'ch', 'ccx', 'ccz', 'cswap'})
+_SELF_INVERSE_BASES = frozenset({'x', 'y', 'z', 'h', 'swap'})
+_DIAGONAL = frozenset({'z', 's', 'sdg', 't', 'tdg', 'rz', 'p', 'u1'})
+
+PeepholeReport = collections.namedtuple('PeepholeReport', ['size_before', 'size_after', 'removed', 'x_pairs',
+                                                           'polarity_rewrites', 'inverse_pairs', 'barriers_removed'])
+PeepholeReport.__doc__ = """ Result of a peephole run: number of gates (without barriers) before and after, removed gates
+    by name (negative for the X gates added when lowering open controls), X pairs cancelled, controls flipped, inverse
+    pairs cancelled and barriers removed. Every removed gate is saved once per Grover iteration. """
+
+PeepholeResult = collections.namedtuple('PeepholeResult', ['circuit', 'report'])
+PeepholeResult.__doc__ = """ Result of 'peephole': optimized circuit and its 'PeepholeReport' """
+
+
+def _conditioned(op):
+    # '_condition' avoids the deprecation warning of 'condition' on every gate
+    return getattr(op, '_condition', None) is not None
+
+
+def _roles(op, num_qubits):
+    # role of every qubit of a gate: 'c' diagonal (controls, phase gates), 't' target of an X, 'o' anything else
+    if _conditioned(op):
+        return ('o',) * num_qubits
+    name = op.name
+    if name == 'x':
+        return ('t',)
+    if name in _DIAGONAL:
+        return ('c',) * num_qubits
+    if isinstance(op, ControlledGate):
+        k = op.num_ctrl_qubits
+        base = op.base_gate.name
+        if base == 'x':
+            # extra qubits of mcx_vchain and mcx_recursive are ancillas
+            return ('c',) * k + ('t',) + ('o',) * (num_qubits - k - 1)
+        if base in _DIAGONAL and num_qubits == k + 1:
+            return ('c',) * num_qubits
+        return ('c',) * k + ('o',) * (num_qubits - k)
+    return ('o',) * num_qubits
+
+
+def _is_self_inverse(op):
+    if _conditioned(op):
+        return False
+    if op.name in _SELF_INVERSE:
+        return True
+    return (isinstance(op, ControlledGate) and op.base_gate.name in _SELF_INVERSE_BASES
+            and op.num_qubits == op.num_ctrl_qubits + op.base_gate.num_qubits)
+
+
+class _Item:
+    __slots__ = ('op', 'qubits', 'clbits', 'roles', 'alive', 'role_map')
+
+    def __init__(self, op, qubits, clbits, roles):
+        self.op, self.qubits, self.clbits, self.roles, self.alive = op, qubits, clbits, roles, True
+        self.role_map = None
+
+    def role(self, qubit):
+        if self.role_map is None:
+            self.role_map = dict(zip(self.qubits, self.roles))
+        return self.role_map.get(qubit)
+
+
+class _Optimizer:
+    # one forward walk over the instructions with one list of gates per qubit
+
+    def __init__(self, num_qubits, barriers, polarity, window):
+        self.items = []
+        self.wires = [[] for _ in range(num_qubits)]
+        self.barriers = barriers
+        self.polarity = polarity
+        self.window = window
+        self.keys = {}
+        self.descriptions = {}
+        self.variants = {}
+        self.removed = collections.Counter()
+        self.x_pairs = self.polarity_rewrites = self.inverse_pairs = self.barriers_removed = 0
+
+    def key(self, op):
+        return qTemplates.operation_key(op, self.keys)
+
+    def describe(self, op):
+        # (roles, self-inverse) of a gate, computed once per gate object
+        cached = self.descriptions.get(id(op))
+        if cached is None or cached[0] is not op:
+            cached = self.descriptions[id(op)] = (op, _roles(op, op.num_qubits), _is_self_inverse(op))
+        return cached[1], cached[2]
+
+    def with_ctrl_state(self, op, ctrl_state):
+        # one gate object per (gate, control state), shared by all its uses
+        variant_key = (self.key(op), ctrl_state)
+        variant = self.variants.get(variant_key)
+        if variant is None:
+            variant = op.to_mutable()
+            variant.ctrl_state = ctrl_state
+            self.variants[variant_key] = variant
+        return variant
+
+    def walk(self, qubit):
+        # alive gates on 'qubit', last first, at most 'window' of them
+        wire = self.wires[qubit]
+        while wire and not self.items[wire[-1]].alive:
+            wire.pop()
+        seen = 0
+        for index in reversed(wire):
+            item = self.items[index]
+            if not item.alive:
+                continue
+            yield index, item
+            seen += 1
+            if seen == self.window:
+                return
+
+    def kill(self, item):
+        item.alive = False
+        self.removed[item.op.name] += 1
+
+    def append(self, op, qubits, clbits=()):
+        if op.name == 'barrier':
+            if self.barriers == 'drop':
+                self.barriers_removed += 1
+                return
+            if self.barriers == 'merge' and self.merge_barrier(qubits):
+                return
+            roles, self_inverse = ('o',) * len(qubits), False
+        elif clbits:
+            roles, self_inverse = ('o',) * len(qubits), False
+        else:
+            roles, self_inverse = self.describe(op)
+        if self_inverse and (self.cancel_x(qubits[0]) if op.name == 'x' else self.cancel_inverse(op, qubits, roles)):
+            self.removed[op.name] += 1
+            return
+        item = _Item(op, qubits, clbits, roles)
+        self.items.append(item)
+        for q in qubits:
+            self.wires[q].append(len(self.items) - 1)
+
+    def merge_barrier(self, qubits):
+        # a barrier right after another barrier (the last alive item) is merged into it
+        for index in range(len(self.items) - 1, -1, -1):
+            item = self.items[index]
+            if not item.alive:
+                continue
+            if item.op.name != 'barrier':
+                return False
+            merged = tuple(sorted(set(item.qubits) | set(qubits)))
+            for q in merged:
+                if q not in item.qubits:
+                    self.wires[q].append(index)
+            item.qubits, item.roles, item.role_map = merged, ('o',) * len(merged), None
+            item.op = qiskit.circuit.Barrier(len(merged))
+            self.barriers_removed += 1
+            return True
+        return False
+
+    def cancel_x(self, qubit):
+        flips = []
+        for _, item in self.walk(qubit):
+            position = item.qubits.index(qubit)
+            if item.op.name == 'x' and item.roles[0] == 't':
+                self.kill(item)
+                for flipped, flipped_position in flips:
+                    flipped.op = self.with_ctrl_state(flipped.op, flipped.op.ctrl_state ^ (1 << flipped_position))
+                self.x_pairs += 1
+                self.polarity_rewrites += len(flips)
+                return True
+            role = item.roles[position]
+            if role == 't':
+                continue
+            if self.polarity and role == 'c' and isinstance(item.op, ControlledGate) and position < item.op.num_ctrl_qubits:
+                flips.append((item, position))
+                continue
+            return False
+        return False
+
+    def commutes(self, item, roles):
+        # same role, control or X target, on every shared qubit; 'roles' maps the qubits of the new gate to their roles
+        if len(item.qubits) > len(roles):
+            pairs = ((item.role(q), role) for q, role in roles.items())
+        else:
+            pairs = ((role, roles.get(q)) for q, role in zip(item.qubits, item.roles))
+        for role, other in pairs:
+            if role is not None and other is not None and (role != other or role == 'o'):
+                return False
+        return True
+
+    def between(self, qubit, index):
+        # alive gates on 'qubit' after the item 'index', or None if the window ends before reaching it
+        gates = []
+        for other_index, other in self.walk(qubit):
+            if other_index <= index:
+                return gates
+            gates.append(other)
+        return gates if len(gates) < self.window else None
+
+    def cancel_inverse(self, op, qubits, roles):
+        roles = dict(zip(qubits, roles))
+        key = None
+        for index, item in self.walk(qubits[0]):
+            if item.qubits == qubits and self.describe(item.op)[1]:
+                key = self.key(op) if key is None else key
+                if self.key(item.op) == key:
+                    for q in qubits[1:]:
+                        gates = self.between(q, index)
+                        if gates is None or not all(self.commutes(other, roles) for other in gates):
+                            return False
+                    self.kill(item)
+                    self.inverse_pairs += 1
+                    return True
+            if not self.commutes(item, roles):
+                return False
+        return False
+
+    def alive(self):
+        return [item for item in self.items if item.alive]
+
+
+def _lowered(items):
+    # gates with open controls as X . closed gate . X, for bases without open controls
+    closed_gates = {}
+    xGate = qiskit.circuit.library.XGate()
+    for item in items:
+        op = item.op
+        if not isinstance(op, ControlledGate) or op.ctrl_state == 2 ** op.num_ctrl_qubits - 1:
+            yield op, item.qubits, item.clbits
+            continue
+        closed = closed_gates.get(id(op))
+        if closed is None or closed[0] is not op:
+            gate = op.to_mutable()
+            gate.ctrl_state = None
+            closed = closed_gates[id(op)] = (op, gate)
+        open_qubits = [q for i, q in enumerate(item.qubits[:op.num_ctrl_qubits]) if not (op.ctrl_state >> i) & 1]
+        for q in open_qubits:
+            yield xGate, (q,), ()
+        yield closed[1], item.qubits, item.clbits
+        for q in open_qubits:
+            yield xGate, (q,), ()
+
+
+def _open_controls(op):
+    if not isinstance(op, ControlledGate):
+        return 0
+    return sum(1 for i in range(op.num_ctrl_qubits) if not (op.ctrl_state >> i) & 1)
+
+
+def peephole(circuit, barriers='drop', open_controls=False, polarity=True, window=64):
+    ''' Optimized copy of 'circuit' (same registers) and its 'PeepholeReport' (see the module docstring) '''
+    if barriers not in BARRIER_MODES:
+        raise ValueError(f"Unknown barrier mode '{barriers}', expected one of {BARRIER_MODES}")
+    index = {q: i for i, q in enumerate(circuit.qubits)}
+    optimizer = _Optimizer(circuit.num_qubits, barriers, polarity, window)
+    for inst in circuit.data:
+        optimizer.append(inst.operation, tuple(index[q] for q in inst.qubits), inst.clbits)
+    items = optimizer.alive()
+    if not open_controls:
+        lowering = _Optimizer(circuit.num_qubits, barriers, False, window)
+        for op, qubits, clbits in _lowered(items):
+            lowering.append(op, qubits, clbits)
+        added = 2 * sum(_open_controls(item.op) for item in items)
+        optimizer.removed['x'] += lowering.removed['x'] - added
+        for name, count in lowering.removed.items():
+            if name != 'x':
+                optimizer.removed[name] += count
+        optimizer.x_pairs += lowering.x_pairs
+        optimizer.inverse_pairs += lowering.inverse_pairs
+        optimizer.barriers_removed += lowering.barriers_removed
+        items = lowering.alive()
+
+    out = circuit.copy_empty_like()
+    qubits = circuit.qubits
+    for item in items:
+        out._append(qiskit.circuit.CircuitInstruction(item.op, tuple(qubits[q] for q in item.qubits), item.clbits))
+    report = PeepholeReport(circuit.size(), out.size(), {name: n for name, n in optimizer.removed.items() if n},
+                            optimizer.x_pairs, optimizer.polarity_rewrites, optimizer.inverse_pairs,
+                            optimizer.barriers_removed)
+    return PeepholeResult(out, report)
+
+
+class OraclePeephole(TransformationPass):
+    """ 'peephole' as a transpiler pass, to run before the basis translation; the report of the last run is stored in
+        the property set as 'peephole_report' """
+
+    def __init__(self, barriers='drop', open_controls=False, polarity=True, window=64):
+        super().__init__()
+        self.barriers = barriers
+        self.open_controls = open_controls
+        self.polarity = polarity
+        self.window = window
+
+    def run(self, dag):
+        result = peephole(dag_to_circuit(dag), self.barriers, self.open_controls, self.polarity, self.window)
+        self.property_set['peephole_report'] = result.report
+        return circuit_to_dag(result.circuit)
@@ -0,0 +1,95 @@
+"""
+Batched, parallel simulation of many circuits or many Grover jobs on the local Aer simulator.
+
+Each circuit is transpiled once and the transpiled circuit is the one that runs. Circuits are split in batches that a
+pool of threads or processes transpiles together (one 'transpile' call per batch); the worker then runs the circuits of
+its batch one by one, because every circuit gets its own deterministic seed 'seed + position in the input list' and Aer
+only takes one 'seed_simulator' per 'run' call. So the results do not depend on the pool or on the batch size.
+
+    >>> jobs = [qRunner.GroverJob(nodes, edges, colors, iterations) for edges in graphs]
+    >>> results = qRunner.run_jobs(jobs, shots=1024, executor='process')
+    >>> results[0].colorings   # {(mask node 0, mask node 1, ...): count}
+"""
+import collections
+import concurrent.futures
+import os
+
+import qiskit
+from qiskit_aer import AerSimulator
+
+import gatesUPCT
+import qGrover
+import qShots
+
+GroverJob = collections.namedtuple('GroverJob', ['nodes', 'edges', 'colors', 'iterations'])
+GroverJob.__doc__ = """ Grover search with 'gatesUPCT.oracle_creator_Grover'; 'iterations' None plans them with 'qGrover.plan_iterations' """
+
+RunResult = collections.namedtuple('RunResult', ['counts', 'colorings', 'seed'])
+RunResult.__doc__ = """ Raw counts of one circuit, the same counts decoded into per-node color masks (None if not decoded) and its seed """
+
+
+def grover_circuit(job):
+    ''' Grover search circuit of a 'GroverJob', measuring the one-hot search register into its first classical bits '''
+    oracle = gatesUPCT.oracle_creator_Grover(job.nodes, list(job.edges), job.colors)
+    n = job.nodes * job.colors
+    iterations = job.iterations
+    if iterations is None:
+        iterations = qGrover.plan_iterations(job.nodes, job.edges, job.colors, one_color=False).iterations
+    return gatesUPCT.grover_search(oracle, 1, n, iterations=iterations)
+
+
+def decode_counts(counts, nodes, colors):
+    ''' Counts over the measured search register decoded into {per-node color masks: count} '''
+    colorings = collections.Counter()
+    masks = qShots.color_masks(qShots.shot_keys(list(counts), nodes * colors), nodes, colors)
+    for row, count in zip(masks.tolist(), counts.values()):
+        colorings[tuple(row)] += count
+    return dict(colorings)
+
+
+def _run_batch(circuits, shots, seeds, method, transpile_seed):
+    # module level so that it can be sent to a process pool; one 'run' per circuit keeps the seed of every circuit (Aer
+    # derives the seeds of the experiments of a single 'run' from the first one, so they would depend on the batch)
+    simulator = AerSimulator(method=method)
+    transpiled = qiskit.transpile(circuits, simulator, seed_transpiler=transpile_seed)
+    counts = []
+    for circuit, seed in zip(transpiled, seeds):
+        result = simulator.run(circuit, shots=shots, seed_simulator=seed).result()
+        counts.append(result.get_counts())
+    return counts
+
+
+def run_circuits(circuits, shots=1024, seed=1234, executor='thread', max_workers=None, batch_size=None, method='automatic',
+                 decode=None):
+    ''' Simulates a list of circuits and returns a list of 'RunResult' in the same order.
+        'executor' is 'thread', 'process' or None (serial). 'decode' is an optional (nodes, colors) pair, or a list of them
+        (one per circuit), to fill 'colorings'.
+    '''
+    circuits = list(circuits)
+    max_workers = max_workers or os.cpu_count() or 1
+    if batch_size is None:
+        batch_size = max(1, -(-len(circuits) // max_workers))
+    seeds = [seed + i for i in range(len(circuits))]
+    batches = [(circuits[i:i + batch_size], seeds[i:i + batch_size]) for i in range(0, len(circuits), batch_size)]
+
+    if executor is None or len(batches) <= 1:
+        all_counts = [c for batch, s in batches for c in _run_batch(batch, shots, s, method, seed)]
+    else:
+        pool_class = {'thread': concurrent.futures.ThreadPoolExecutor,
+                      'process': concurrent.futures.ProcessPoolExecutor}[executor]
+        with pool_class(max_workers=max_workers) as pool:
+            futures = [pool.submit(_run_batch, batch, shots, s, method, seed) for batch, s in batches]
+            all_counts = [c for f in futures for c in f.result()]
+
+    if decode is None or isinstance(decode, tuple):
+        decode = [decode] * len(circuits)
+    return [RunResult(counts, decode_counts(counts, *d) if d is not None else None, s)
+            for counts, d, s in zip(all_counts, decode, seeds)]
+
+
+def run_jobs(jobs, shots=1024, seed=1234, executor='process', max_workers=None, batch_size=None, method='automatic'):
+    ''' Builds the Grover circuit of every 'GroverJob' and runs them with 'run_circuits', decoding the colorings '''
+    jobs = list(jobs)
+    circuits = [grover_circuit(job) for job in jobs]
+    return run_circuits(circuits, shots, seed, executor, max_workers, batch_size, method,
+                        decode=[(job.nodes, job.colors) for job in jobs])
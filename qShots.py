@@ -0,0 +1,196 @@
+"""
+Aggregation of measurement shots as packed integer arrays: this module creates no Python string per shot.
+
+Every shot is reduced to the key of its search register in the format of 'qStore' (one uint64 per shot for up to 64
+qubits, big-endian words viewed as a void array beyond that; the search register in the lowest bits, as measured by
+'gatesUPCT.grover_search'). The accepted memory formats are:
+    - packed bytes, an (shots, bytes) uint8 array as in 'BitArray.array' of the V2 samplers (big-endian, the first
+      classical bit in the lowest bit of the last byte), or a 'BitArray' itself
+    - an integer array with one value per shot
+    - the hexadecimal or binary strings of 'result.get_memory()', for results that only come in that form (the strings
+      exist already; they are parsed once into integers)
+'ShotAggregator' turns chunks of shots into (outcomes, counts) with 'np.unique' and merges them into the running
+totals, so memory scales with the number of distinct outcomes and not with the shots; partial aggregates of other
+workers are merged the same way. The one-hot search register is decoded in bulk into one color per node:
+
+    >>> for aggregator in qShots.stream(circuit, shots=10**7, chunk_shots=10**6, width=nodes * colors):
+    ...     print(aggregator.shots, len(aggregator))                    # running totals after every chunk
+    >>> colorings, counts = aggregator.colorings(nodes, colors)          # (distinct, nodes) colors, -1 when not one-hot
+    >>> qStore.score_counts(aggregator.result(), solutions).success_probability
+"""
+import numpy as np
+
+import qStore
+
+
+def _as_packed(memory):
+    # 'BitArray' (duck-typed, so that qiskit is not imported here) -> its uint8 array
+    return memory.array if hasattr(memory, 'array') and hasattr(memory, 'num_bits') else memory
+
+
+def shot_keys(memory, width):
+    ''' Keys of the lowest 'width' bits of every shot of 'memory' (see the module docstring for the formats) '''
+    memory = _as_packed(memory)
+    words = qStore._words(width)
+    if isinstance(memory, np.ndarray) and memory.dtype == np.uint8 and memory.ndim == 2:
+        size = 8 * words
+        packed = np.zeros((len(memory), size), dtype=np.uint8)
+        used = min(size, memory.shape[1])
+        packed[:, size - used:] = memory[:, memory.shape[1] - used:]
+        extra = 8 * size - width
+        packed[:, :extra // 8] = 0
+        if extra % 8:
+            packed[:, extra // 8] &= np.uint8(0xFF >> (extra % 8))
+        if words == 1:
+            return packed.view('>u8').reshape(-1).astype(np.uint64)
+        return packed.view(f'V{size}').reshape(-1)
+    if isinstance(memory, np.ndarray) and memory.dtype.kind in 'iu':
+        keys = memory.astype(np.uint64).reshape(-1)
+        if width >= 64:
+            return keys if words == 1 else qStore.to_keys(keys.tolist(), width)
+        return keys & np.uint64((1 << width) - 1)
+    mask = (1 << width) - 1
+    values = (int(value, 16 if value.startswith('0x') else 2) & mask for value in
+              (str(shot).replace(' ', '') for shot in memory))
+    if words == 1:
+        return np.fromiter(values, dtype=np.uint64)
+    return qStore.to_keys(list(values), width)
+
+
+def _unique_counts(keys, counts=None):
+    # sorted distinct keys and the total count of each one
+    if counts is None:
+        return np.unique(keys, return_counts=True)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    totals = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(totals, inverse.reshape(-1), counts)
+    return unique, totals
+
+
+def aggregate(memory, width, chunk_shots=1 << 20):
+    ''' (distinct keys, counts) of all the shots of 'memory' '''
+    return ShotAggregator(width, chunk_shots).add(memory).result()
+
+
+class ShotAggregator:
+    """ Running (outcomes, counts) of the search register over chunks of shots or partial aggregates """
+
+    def __init__(self, width, chunk_shots=1 << 20):
+        self.width = width
+        self.chunk_shots = chunk_shots
+        self.keys = qStore.to_keys([], width)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.shots = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _merge(self, keys, counts):
+        if len(self.keys):
+            keys, counts = _unique_counts(np.concatenate([self.keys, keys]), np.concatenate([self.counts, counts]))
+        self.keys, self.counts = keys, np.asarray(counts, dtype=np.int64)
+        self.shots = int(self.counts.sum())
+
+    def add(self, memory):
+        ''' Adds the shots of 'memory', 'chunk_shots' at a time; returns the aggregator '''
+        memory = _as_packed(memory)
+        for start in range(0, len(memory), self.chunk_shots):
+            self._merge(*_unique_counts(shot_keys(memory[start:start + self.chunk_shots], self.width)))
+        return self
+
+    def add_counts(self, outcomes, counts):
+        ''' Adds a partial aggregate: outcome keys (or integer indexes) and their counts; returns the aggregator '''
+        self._merge(*_unique_counts(qStore.to_keys(outcomes, self.width), np.asarray(counts, dtype=np.int64)))
+        return self
+
+    def merge(self, other):
+        ''' Adds the totals of another aggregator of the same width; returns the aggregator '''
+        return self.add_counts(other.keys, other.counts)
+
+    def result(self):
+        ''' (sorted distinct keys, counts), the pair accepted by 'qStore.score_counts' '''
+        return self.keys, self.counts
+
+    def score(self, solutions, top_k=None):
+        ''' 'qStore.score_counts' of the totals against a 'SolutionSet' '''
+        return qStore.score_counts(self.result(), solutions, top_k)
+
+    def colorings(self, nodes, colors):
+        ''' 'coloring_counts' of the totals '''
+        return coloring_counts(self.keys, self.counts, nodes, colors)
+
+
+# Decoding of the one-hot search register
+
+def key_bits(keys, width):
+    ''' Boolean (len(keys), width) array, column q the value of qubit q '''
+    keys = np.asarray(keys)
+    if keys.dtype.kind != 'V':
+        keys = keys.astype('>u8')
+    raw = keys.view(np.uint8).reshape(len(keys), -1)[:, ::-1]
+    return np.unpackbits(raw, axis=1, count=width, bitorder='little').astype(bool)
+
+
+def decode_one_hot(keys, nodes, colors, chunk_size=1 << 16):
+    ''' Color of every node for every key, as an int16 (len(keys), nodes) array: the color when exactly one qubit of the
+        node is set, -1 otherwise (no color or several, see 'color_masks' for those) '''
+    keys = np.asarray(keys)
+    decoded = np.empty((len(keys), nodes), dtype=np.int16)
+    for start in range(0, len(keys), chunk_size):
+        bits = key_bits(keys[start:start + chunk_size], nodes * colors).reshape(-1, nodes, colors)
+        decoded[start:start + len(bits)] = np.where(bits.sum(axis=2) == 1, bits.argmax(axis=2), -1)
+    return decoded
+
+
+def color_masks(keys, nodes, colors, chunk_size=1 << 16):
+    ''' Per-node color masks of every key (as 'qSolutions.index_to_masks'), a uint64 (len(keys), nodes) array '''
+    keys = np.asarray(keys)
+    weights = np.uint64(1) << np.arange(colors, dtype=np.uint64)
+    masks = np.empty((len(keys), nodes), dtype=np.uint64)
+    for start in range(0, len(keys), chunk_size):
+        bits = key_bits(keys[start:start + chunk_size], nodes * colors).reshape(-1, nodes, colors)
+        masks[start:start + len(bits)] = (bits * weights).sum(axis=2, dtype=np.uint64)
+    return masks
+
+
+def coloring_counts(keys, counts, nodes, colors):
+    ''' Distinct decoded colorings (rows of 'decode_one_hot', all the invalid registers of a node share -1) and their
+        total counts, sorted by decreasing count '''
+    decoded, inverse = np.unique(decode_one_hot(keys, nodes, colors), axis=0, return_inverse=True)
+    totals = np.zeros(len(decoded), dtype=np.int64)
+    np.add.at(totals, inverse.reshape(-1), np.asarray(counts, dtype=np.int64))
+    order = np.argsort(-totals, kind='stable')
+    return decoded[order], totals[order]
+
+
+# Sampling
+
+def stream(circuit, shots, chunk_shots=1 << 20, seed=None, width=None, register=None, method='automatic'):
+    ''' Samples 'circuit' on the local Aer simulator ('method' as in 'qRunner.run_circuits') 'chunk_shots' at a time and
+        yields the 'ShotAggregator' after every chunk. The shots are read packed from the classical 'register' (the first
+        one by default); 'width' defaults to all its bits. Chunk i runs with seed 'seed + i', so the totals do not depend
+        on where a run is stopped. Aer's 'SamplerV2' still builds a hexadecimal string per shot internally (it runs with
+        'memory=True') before packing them into its 'BitArray'; those strings only live for one chunk, so 'chunk_shots'
+        bounds them.
+    '''
+    import qiskit
+    from qiskit_aer import AerSimulator
+    from qiskit_aer.primitives import SamplerV2
+    simulator = AerSimulator(method=method)
+    transpiled = qiskit.transpile(circuit, simulator, seed_transpiler=seed)
+    register = register or circuit.cregs[0].name
+    width = len(circuit.cregs[[creg.name for creg in circuit.cregs].index(register)]) if width is None else width
+    aggregator = ShotAggregator(width, chunk_shots)
+    for i, start in enumerate(range(0, shots, chunk_shots)):
+        sampler = SamplerV2(seed=None if seed is None else seed + i, options={'backend_options': {'method': method}})
+        result = sampler.run([transpiled], shots=min(chunk_shots, shots - start)).result()[0]
+        aggregator.add(getattr(result.data, register))
+        yield aggregator
+
+
+def sample(circuit, shots, chunk_shots=1 << 20, seed=None, width=None, register=None, method='automatic'):
+    ''' Final 'ShotAggregator' of 'stream' '''
+    aggregator = None
+    for aggregator in stream(circuit, shots, chunk_shots, seed, width, register, method):
+        pass
+    return aggregator
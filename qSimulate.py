@@ -0,0 +1,134 @@
+"""
+Automatic choice of the simulation method for oracle verification and simulation circuits.
+
+'choose_method' looks at a circuit and picks, in this order:
+    'classical'            -> only X/CX/CCX/MCX/SWAP and phase (Z, controlled Z) gates on a basis input, as the circuits
+                              of 'gatesUPCT.check_solution': run once with the bit engine of 'qClassical', any width
+    'stabilizer'           -> only Clifford gates (Aer stabilizer method), any width
+    'statevector'          -> at most 'max_statevector_qubits' qubits
+    'extended_stabilizer'  -> Clifford gates plus a few T/CCX (T-count estimate up to 'max_t_count')
+    'matrix_product_state' -> everything else; the bond dimension is bounded by 2^(qubits put in superposition), which
+                              is small for basis-state inputs with a few prepared qubits
+and returns a 'MethodChoice' with the reason and the figures it used. 'run' simulates with the chosen method and
+reports it, so a single-assignment check of a 100+ qubit oracle runs locally:
+
+    >>> result = qSimulate.verify_assignment(oracle, colors, [0, 1, 2, 0, 1, 1])
+    >>> result.output, result.choice.method        # (True, 'classical')
+"""
+import collections
+
+import numpy as np
+
+import qClassical
+
+CLIFFORD_GATES = frozenset({'id', 'x', 'y', 'z', 'h', 's', 'sdg', 'sx', 'sxdg', 'cx', 'cy', 'cz', 'swap', 'iswap', 'ecr',
+                            'dcx'})
+_NON_GATES = frozenset({'barrier', 'measure', 'delay'})
+_T_COST = {'t': 1, 'tdg': 1, 'ccx': 7, 'ccz': 7}
+
+MethodChoice = collections.namedtuple('MethodChoice', ['method', 'reason', 'num_qubits', 't_count', 'superposition_qubits'])
+MethodChoice.__doc__ = """ Result of 'choose_method': simulation method, why it was chosen, width of the circuit, T-count
+    estimate (None when a gate has no small Clifford+T form) and number of qubits that leave the computational basis """
+
+SimulationResult = collections.namedtuple('SimulationResult', ['counts', 'choice'])
+SimulationResult.__doc__ = """ Result of 'run': counts in the format of 'result.get_counts()' and the 'MethodChoice' used """
+
+AssignmentResult = collections.namedtuple('AssignmentResult', ['output', 'counts', 'choice'])
+AssignmentResult.__doc__ = """ Result of 'verify_assignment': most frequent value of the measured output bit, counts and method """
+
+
+def _instructions_are_plain(qc):
+    return all(getattr(inst.operation, 'condition', None) is None for inst in qc.data)
+
+
+def _t_count(qc):
+    total = 0
+    for inst in qc.data:
+        name = inst.operation.name
+        if name in _NON_GATES or name in CLIFFORD_GATES:
+            continue
+        if name not in _T_COST:
+            return None
+        total += _T_COST[name]
+    return total
+
+
+def _superposition_qubits(qc):
+    # qubits reached by a gate that is not classical (nor a phase flip): they can leave the computational basis
+    qubits = set()
+    for inst in qc.data:
+        op = inst.operation
+        if op.name in _NON_GATES or qClassical._classify(op, tuple(range(op.num_qubits))) is not None:
+            continue
+        qubits.update(qc.find_bit(q).index for q in inst.qubits)
+    return len(qubits)
+
+
+def choose_method(qc, max_statevector_qubits=26, max_t_count=16):
+    ''' Simulation method for 'qc' (see the module docstring) as a 'MethodChoice' '''
+    n = qc.num_qubits
+    plain = _instructions_are_plain(qc)
+    if plain and qClassical.compile_circuit(qc, allow_preparation=False).stop_index is None:
+        return MethodChoice('classical', 'reversible circuit on a basis input', n, 0, 0)
+    t_count = _t_count(qc)
+    superposition = _superposition_qubits(qc)
+    if t_count == 0:
+        return MethodChoice('stabilizer', 'Clifford circuit', n, 0, superposition)
+    if n <= max_statevector_qubits:
+        return MethodChoice('statevector', f'{n} qubits <= {max_statevector_qubits}', n, t_count, superposition)
+    if t_count is not None and t_count <= max_t_count:
+        return MethodChoice('extended_stabilizer', f'T-count {t_count} <= {max_t_count}', n, t_count, superposition)
+    return MethodChoice('matrix_product_state', f'{n} qubits, {superposition} of them in superposition', n, t_count,
+                        superposition)
+
+
+def _format_counts(qc, clbit_values, shots):
+    bits = []
+    for register in reversed(qc.cregs):
+        bits.append(''.join(str(clbit_values[qc.find_bit(c).index]) for c in reversed(register)))
+    return {' '.join(bits): shots}
+
+
+def _run_classical(qc, shots):
+    # one word of state is enough for the single basis input; measurements read the state where they appear
+    state = np.zeros((qc.num_qubits, 1), dtype=np.uint64)
+    clbit_values = [0] * qc.num_clbits
+    segment = qc.copy_empty_like()
+
+    def flush(segment):
+        qClassical.run_packed(qClassical.compile_circuit(segment, allow_preparation=False), state)
+        return qc.copy_empty_like()
+
+    for inst in qc.data:
+        if inst.operation.name != 'measure':
+            segment._append(inst)
+            continue
+        segment = flush(segment)
+        clbit_values[qc.find_bit(inst.clbits[0]).index] = int(state[qc.find_bit(inst.qubits[0]).index, 0] & np.uint64(1))
+    flush(segment)
+    return _format_counts(qc, clbit_values, shots)
+
+
+def run(qc, shots=1024, seed=None, method='auto', **choice_options):
+    ''' Simulates 'qc' with the method of 'choose_method' (or the one given) and returns a 'SimulationResult' '''
+    if method == 'auto':
+        choice = choose_method(qc, **choice_options)
+    else:
+        choice = MethodChoice(method, 'requested', qc.num_qubits, None, None)
+    if choice.method == 'classical':
+        return SimulationResult(_run_classical(qc, shots), choice)
+    import qiskit
+    from qiskit_aer import AerSimulator
+    simulator = AerSimulator(method=choice.method)
+    transpiled = qiskit.transpile(qc, simulator, seed_transpiler=seed)
+    counts = simulator.run(transpiled, shots=shots, seed_simulator=seed).result().get_counts()
+    return SimulationResult(counts, choice)
+
+
+def verify_assignment(oracle, colors, color_assignment, shots=16, seed=None, **choice_options):
+    ''' Runs 'gatesUPCT.check_solution' for one coloring with the automatically chosen method; 'output' is the most
+        frequent value of the measured output qubit '''
+    import gatesUPCT
+    result = run(gatesUPCT.check_solution(colors, color_assignment, oracle), shots, seed, **choice_options)
+    best = max(result.counts, key=result.counts.get).replace(' ', '')
+    return AssignmentResult(best[-1] == '1', result.counts, result.choice)
@@ -0,0 +1,179 @@
+"""
+Exact classical counting and enumeration of the valid colorings of a graph.
+
+Replaces the 'itertools.product' brute force of 'comprobacion_coloreado.ipynb'. Two semantics are supported, matching the
+two families of oracles:
+    one_color=True  -> every node has exactly one color ('oracle_creator_CdC_OH', 'coloreadoGrafos_nodos1Color.ipynb')
+    one_color=False -> every node has at least one color ('oracle_creator', 'coloreadoGrafos_nodosMas1Color.ipynb')
+In both cases adjacent nodes cannot share any color. Each node's colors are handled as a bitmask (bit k <-> color k), which is
+also the one-hot layout of the search register: qubit node*colors + k.
+
+    >>> m = qSolutions.count_colorings(nodes, edges, colors, one_color=False)
+    >>> circuit = gatesUPCT.grover_search(oracle, m, nodes * colors)
+"""
+import numpy as np
+
+
+def color_domain(colors, one_color=True):
+    ''' Color masks a single node can take '''
+    if one_color:
+        return [1 << k for k in range(colors)]
+    return list(range(1, 2 ** colors))
+
+
+def _neighbors(nodes, edges):
+    neighbors = [set() for _ in range(nodes)]
+    for a, b in edges:
+        neighbors[a].add(b)
+        neighbors[b].add(a)
+    return neighbors
+
+
+def elimination_order(nodes, edges):
+    ''' Node order that keeps the DP frontier small: BFS per component, starting at the highest degree node '''
+    neighbors = _neighbors(nodes, edges)
+    seen = [False] * nodes
+    order = []
+    for root in sorted(range(nodes), key=lambda v: -len(neighbors[v])):
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = [root]
+        for v in queue:
+            order.append(v)
+            for w in sorted(neighbors[v], key=lambda w: -len(neighbors[w])):
+                if not seen[w]:
+                    seen[w] = True
+                    queue.append(w)
+    return order
+
+
+def count_colorings(nodes, edges, colors, one_color=True):
+    ''' Exact number of valid colorings, computed with a dynamic programming pass over the nodes in 'elimination_order'.
+        The DP state is the tuple of masks of the already colored nodes that still have uncolored neighbors, so the cost
+        depends on the width of that frontier instead of on the 2^(nodes*colors) search space.
+    '''
+    neighbors = _neighbors(nodes, edges)
+    domain = color_domain(colors, one_color)
+    order = elimination_order(nodes, edges)
+    position = {v: i for i, v in enumerate(order)}
+    last_use = [max([position[w] for w in neighbors[v]] + [position[v]]) for v in range(nodes)]
+
+    frontier = []
+    states = {(): 1}
+    for step, v in enumerate(order):
+        slots = [i for i, w in enumerate(frontier) if w in neighbors[v]]
+        new_frontier = frontier + [v]
+        keep = [i for i, w in enumerate(new_frontier) if last_use[w] > step]
+        new_states = {}
+        for state, ways in states.items():
+            used = 0
+            for i in slots:
+                used |= state[i]
+            for mask in domain:
+                if mask & used:
+                    continue
+                full = state + (mask,)
+                key = tuple(full[i] for i in keep)
+                new_states[key] = new_states.get(key, 0) + ways
+        frontier = [new_frontier[i] for i in keep]
+        states = new_states
+    return sum(states.values())
+
+
+def solution_indexes(nodes, edges, colors, one_color=True):
+    ''' Sorted array (uint64) with the basis index of the one-hot search register for every valid coloring.
+        Partial colorings are extended node by node as NumPy arrays, pruning against the already colored neighbors.
+    '''
+    if nodes * colors > 64:
+        raise ValueError("solution_indexes needs nodes*colors <= 64, use 'iter_colorings' instead")
+    neighbors = _neighbors(nodes, edges)
+    domain = np.array(color_domain(colors, one_color), dtype=np.uint64)
+    field = np.uint64(2 ** colors - 1)
+    partial = np.zeros(1, dtype=np.uint64)
+    placed = set()
+    for v in elimination_order(nodes, edges):
+        shift = np.uint64(v * colors)
+        used = np.zeros(len(partial), dtype=np.uint64)
+        for w in neighbors[v] & placed:
+            used |= (partial >> np.uint64(w * colors)) & field
+        candidates = (domain[None, :] & used[:, None]) == 0
+        rows, cols = np.nonzero(candidates)
+        partial = partial[rows] | (domain[cols] << shift)
+        placed.add(v)
+    return np.sort(partial)
+
+
+def iter_colorings(nodes, edges, colors, one_color=True):
+    ''' Backtracking generator of the valid colorings as tuples of per-node color masks (no size limit) '''
+    neighbors = _neighbors(nodes, edges)
+    domain = color_domain(colors, one_color)
+    order = elimination_order(nodes, edges)
+    masks = [0] * nodes
+
+    def backtrack(i):
+        if i == len(order):
+            yield tuple(masks)
+            return
+        v = order[i]
+        used = 0
+        for w in neighbors[v]:
+            used |= masks[w]
+        for mask in domain:
+            if not mask & used:
+                masks[v] = mask
+                yield from backtrack(i + 1)
+        masks[v] = 0
+
+    return backtrack(0)
+
+
+def valid_indexes_mask(nodes, edges, colors, indexes, one_color=True):
+    ''' Vectorized check of a batch of basis indexes of the one-hot search register; returns a boolean array '''
+    indexes = np.asarray(indexes, dtype=np.uint64)
+    field = np.uint64(2 ** colors - 1)
+    masks = [(indexes >> np.uint64(v * colors)) & field for v in range(nodes)]
+    valid = np.ones(len(indexes), dtype=bool)
+    for m in masks:
+        valid &= m != 0
+        if one_color:
+            valid &= (m & (m - np.uint64(1))) == 0
+    for a, b in edges:
+        valid &= (masks[a] & masks[b]) == 0
+    return valid
+
+
+def count_colorings_bruteforce(nodes, edges, colors, one_color=True, chunk_size=1 << 22):
+    ''' Counts by evaluating every basis state of the search register in vectorized chunks (reference for small graphs) '''
+    total = 0
+    size = 2 ** (nodes * colors)
+    for start in range(0, size, chunk_size):
+        chunk = np.arange(start, min(start + chunk_size, size), dtype=np.uint64)
+        total += int(valid_indexes_mask(nodes, edges, colors, chunk, one_color).sum())
+    return total
+
+
+def is_valid_coloring(coloring, edges, colors=None, one_color=True):
+    ''' Checks one coloring, given as a list of colors per node (one_color) or as a one-hot list/matrix of nodes x colors '''
+    coloring = np.asarray(coloring)
+    if coloring.ndim == 1 and colors is None:
+        return all(coloring[a] != coloring[b] for a, b in edges)
+    matrix = coloring.reshape(-1, colors) if coloring.ndim == 1 else coloring
+    sums = matrix.sum(axis=1)
+    if (sums == 0).any() or (one_color and (sums > 1).any()):
+        return False
+    return not any((matrix[a] & matrix[b]).any() for a, b in edges)
+
+
+def index_to_masks(index, nodes, colors):
+    ''' Per-node color masks of a basis index of the one-hot search register '''
+    field = 2 ** colors - 1
+    return tuple((int(index) >> (v * colors)) & field for v in range(nodes))
+
+
+def masks_to_index(masks, colors):
+    ''' Basis index of the one-hot search register for the per-node color masks '''
+    index = 0
+    for v, mask in enumerate(masks):
+        index |= int(mask) << (v * colors)
+    return index
@@ -0,0 +1,248 @@
+"""
+Compact, memory-mapped store of solution sets and scoring of simulation results against them.
+
+A solution set is the sorted array of basis indexes of the search register of one graph in one encoding:
+    'one_hot'       -> qubit node*colors + k is color k, exactly one color per node ('oracle_creator_CdC_OH')
+    'one_hot_multi' -> same layout, at least one color per node ('oracle_creator', 'oracle_creator_Grover')
+    'binary'        -> the color of node v as an integer in qubits v*b ... ('gatesUPCT.oracle_creator_binary')
+Registers of up to 64 qubits are stored as one uint64 per solution; wider ones as rows of big-endian uint64 words (most
+significant first), so byte order is numeric order and lookups are a 'searchsorted' over the rows. Sets are saved as
+.npy files named by the SHA-256 of (encoding, nodes, canonical edges, colors), with a small JSON file next to them, and
+opened with 'mmap_mode', so only the pages that a lookup touches are read.
+
+    >>> store = qStore.SolutionStore('solutions')
+    >>> solutions = store.get(nodes, edges, colors, 'one_hot_multi')        # computed with 'qSolutions' the first time
+    >>> qStore.score_counts(counts, solutions).success_probability
+    >>> qStore.score_statevector(statevector, solutions, qubits=range(nodes * colors)).missing
+
+The text files 'allSolutions_*.txt' (kets printed by 'max_prob_combinations', qubit 0 rightmost) are read with
+'read_solutions_text'.
+"""
+import collections
+import json
+import os
+
+import numpy as np
+
+import qCache
+import qSolutions
+
+ENCODINGS = ('one_hot', 'one_hot_multi', 'binary')
+
+Score = collections.namedtuple('Score', ['success_probability', 'precision', 'recall', 'top_k', 'found', 'missing'])
+Score.__doc__ = """ Result of 'score_counts' and 'score_statevector': probability mass (or fraction of shots) on solutions,
+    precision and recall of the 'top_k' most likely outcomes, number of distinct solutions observed with non-zero weight
+    and the solutions that are not among the top-k outcomes (keys as stored in the set) """
+
+
+def register_width(nodes, colors, encoding='one_hot'):
+    ''' Qubits of the search register for the encoding '''
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', use one of {ENCODINGS}")
+    if encoding == 'binary':
+        return nodes * max(1, (colors - 1).bit_length())
+    return nodes * colors
+
+
+def _words(width):
+    return max(1, -(-width // 64))
+
+
+def to_keys(indexes, width):
+    ''' Integer indexes (NumPy array or Python ints of any size) as the keys of a set of this width: a uint64 array,
+        or for width > 64 a void array over rows of big-endian words (returned as they are when already keys) '''
+    words = _words(width)
+    if isinstance(indexes, np.ndarray) and indexes.dtype.kind == 'V':
+        return indexes.reshape(-1)
+    if words == 1:
+        return np.asarray(indexes, dtype=np.uint64).reshape(-1)
+    mask = (1 << 64) - 1
+    rows = np.array([[(int(i) >> (64 * (words - 1 - j))) & mask for j in range(words)] for i in indexes],
+                    dtype='>u8').reshape(-1, words)
+    return rows.view(f'V{8 * words}').reshape(-1)
+
+
+def from_key(key, width):
+    ''' Integer index of one key '''
+    if _words(width) == 1:
+        return int(key)
+    return int.from_bytes(bytes(key), 'big')
+
+
+class SolutionSet:
+    """ Sorted solution keys of one graph and encoding (array in memory or memory-mapped from a store) """
+
+    def __init__(self, keys, nodes, edges, colors, encoding):
+        self.keys = keys
+        self.nodes = nodes
+        self.edges = qCache.canonical_edges(edges)
+        self.colors = colors
+        self.encoding = encoding
+        self.width = register_width(nodes, colors, encoding)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, index):
+        return bool(self.contains(to_keys([index], self.width))[0])
+
+    def contains(self, keys):
+        ''' Boolean array: which of 'keys' (see 'to_keys') are solutions '''
+        keys = np.asarray(keys)
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        pos = np.searchsorted(self.keys, keys)
+        return self.keys[np.minimum(pos, len(self.keys) - 1)] == keys
+
+    def indexes(self):
+        ''' Solutions as Python ints '''
+        return [from_key(key, self.width) for key in self.keys]
+
+    def masks(self):
+        ''' Solutions as tuples of per-node color masks (one-hot encodings only) '''
+        return [qSolutions.index_to_masks(i, self.nodes, self.colors) for i in self.indexes()]
+
+
+def solution_keys(nodes, edges, colors, encoding='one_hot'):
+    ''' Sorted keys of every valid coloring, computed with 'qSolutions' '''
+    width = register_width(nodes, colors, encoding)
+    one_color = encoding != 'one_hot_multi'
+    if nodes * colors <= 64:
+        indexes = qSolutions.solution_indexes(nodes, edges, colors, one_color)
+        if encoding == 'binary':
+            bits = width // nodes
+            field = np.uint64(2 ** colors - 1)
+            binary = np.zeros(len(indexes), dtype=np.uint64)
+            for v in range(nodes):
+                mask = (indexes >> np.uint64(v * colors)) & field
+                for k in range(colors):
+                    binary[mask == np.uint64(1 << k)] |= np.uint64(k << (v * bits))
+            indexes = binary
+        return np.sort(indexes)
+    if encoding == 'binary':
+        bits = width // nodes
+        indexes = (sum((mask.bit_length() - 1) << (v * bits) for v, mask in enumerate(masks))
+                   for masks in qSolutions.iter_colorings(nodes, edges, colors, True))
+    else:
+        indexes = (qSolutions.masks_to_index(masks, colors) for masks in qSolutions.iter_colorings(nodes, edges, colors, one_color))
+    return np.sort(to_keys(list(indexes), width))
+
+
+def read_solutions_text(path, width=None):
+    ''' Basis indexes of the kets of a text file such as 'allSolutions_oneColor.txt' (one '|bits>' per line, spaces
+        ignored), as uint64 keys when they fit in 64 bits and as Python ints otherwise '''
+    indexes = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('|'):
+                bits = line[1:].rstrip('〉⟩>').replace(' ', '')
+                width = len(bits) if width is None else width
+                indexes.append(int(bits, 2))
+    if width is not None and width <= 64:
+        return np.array(indexes, dtype=np.uint64)
+    return indexes
+
+
+class SolutionStore:
+    """ Directory of solution sets (.npy plus .json), opened memory-mapped """
+
+    def __init__(self, directory, mmap_mode='r'):
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, nodes, edges, colors, encoding='one_hot'):
+        key = (encoding, int(nodes), qCache.canonical_edges(edges), int(colors))
+        return os.path.join(self.directory, qCache.key_digest(key) + '.npy')
+
+    def __contains__(self, graph):
+        return os.path.exists(self.path(*graph))
+
+    def save(self, solutions):
+        ''' Writes a 'SolutionSet' (keys must be sorted) and returns its path '''
+        path = self.path(solutions.nodes, solutions.edges, solutions.colors, solutions.encoding)
+        keys = np.asarray(solutions.keys)
+        if keys.dtype.kind == 'V':
+            keys = keys.view('>u8').reshape(len(keys), -1)
+        tmp = path[:-4] + '.tmp.npy'
+        np.save(tmp, keys)
+        os.replace(tmp, path)
+        with open(path[:-4] + '.json', 'w') as f:
+            json.dump({'nodes': solutions.nodes, 'edges': solutions.edges, 'colors': solutions.colors,
+                       'encoding': solutions.encoding, 'width': solutions.width, 'count': len(keys)}, f)
+        return path
+
+    def load(self, nodes, edges, colors, encoding='one_hot'):
+        ''' Memory-mapped 'SolutionSet', or None if it is not in the store '''
+        path = self.path(nodes, edges, colors, encoding)
+        if not os.path.exists(path):
+            return None
+        keys = np.load(path, mmap_mode=self.mmap_mode)
+        if keys.ndim == 2:
+            keys = keys.view(f'V{8 * keys.shape[1]}').reshape(-1)
+        return SolutionSet(keys, nodes, edges, colors, encoding)
+
+    def get(self, nodes, edges, colors, encoding='one_hot'):
+        ''' 'load', computing and saving the set with 'solution_keys' first if it is missing '''
+        if (nodes, edges, colors, encoding) not in self:
+            self.save(SolutionSet(solution_keys(nodes, edges, colors, encoding), nodes, edges, colors, encoding))
+        return self.load(nodes, edges, colors, encoding)
+
+    def import_text(self, path, nodes, edges, colors, encoding='one_hot'):
+        ''' Stores the kets of a text file ('read_solutions_text') as the set of the graph '''
+        width = register_width(nodes, colors, encoding)
+        keys = np.unique(to_keys(read_solutions_text(path, width), width))
+        return self.save(SolutionSet(keys, nodes, edges, colors, encoding))
+
+
+# Scoring
+
+def _score(keys, weights, solutions, top_k, top=None):
+    # 'keys' unique outcomes with their 'weights'; 'top' the positions of the top-k outcomes when already known
+    total = float(weights.sum())
+    in_set = solutions.contains(keys)
+    k = len(solutions) if top_k is None else top_k
+    if top is None:
+        top = np.argsort(-weights, kind='stable')[:k]
+    top = top[weights[top] > 0]
+    hits = in_set[top]
+    recalled = np.zeros(len(solutions), dtype=bool)
+    recalled[np.searchsorted(solutions.keys, keys[top][hits])] = True
+    return Score(float(weights[in_set].sum()) / total if total else 0.0,
+                 float(hits.sum()) / len(top) if len(top) else 0.0,
+                 float(hits.sum()) / len(solutions) if len(solutions) else 1.0,
+                 k, int((in_set & (weights > 0)).sum()), np.asarray(solutions.keys)[~recalled])
+
+
+def score_counts(counts, solutions, top_k=None):
+    ''' Scores measurement counts of the search register against a 'SolutionSet'. 'counts' is the dict of
+        'result.get_counts()' (the search register in the rightmost bits of each bitstring) or a pair of arrays
+        (outcome indexes, counts). 'top_k' defaults to the number of solutions.
+    '''
+    width = solutions.width
+    if isinstance(counts, dict):
+        mask = (1 << width) - 1
+        outcomes = [int(bits.replace(' ', ''), 2) & mask for bits in counts]
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    else:
+        outcomes, weights = counts[0], np.asarray(counts[1], dtype=np.float64)
+    keys, inverse = np.unique(to_keys(outcomes, width), return_inverse=True)
+    return _score(keys, np.bincount(inverse.reshape(-1), weights=weights, minlength=len(keys)), solutions, top_k)
+
+
+def score_statevector(statevector, solutions, qubits=None, top_k=None):
+    ''' Scores a statevector (or array of amplitudes) against a 'SolutionSet'. 'qubits' are the qubits of the search
+        register when the state also holds ancillas (their marginal is taken with 'quantum_f.register_marginal').
+    '''
+    import quantum_f
+    if solutions.width > 64:
+        raise ValueError("Statevectors of more than 64 qubits cannot be scored")
+    if qubits is not None:
+        probs = quantum_f.register_marginal(statevector, list(qubits))
+    else:
+        probs = np.abs(quantum_f._amplitudes(statevector)) ** 2
+    keys = np.arange(len(probs), dtype=np.uint64)
+    k = len(solutions) if top_k is None else top_k
+    top, _ = quantum_f.top_k_states(probs, k)
+    return _score(keys, probs, solutions, top_k, top)
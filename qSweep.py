@@ -0,0 +1,127 @@
+"""
+Chromatic-number search: sweeps the number of colors of a graph, reusing the work that does not depend on it.
+
+'chromatic_sweep' preprocesses the graph once (checked pairs, with 'gatesUPCT.get_extended_edges' if requested,
+neighbor sets and degree counts as in 'oracle_creator_CdC_OH', a greedy clique as lower bound and a largest-degree-first
+greedy coloring as upper bound) and then tries c = lower bound, lower bound + 1, ... up to the upper bound, which is
+known to work:
+    'count'   -> exact number of colorings with 'qSolutions.count_colorings' (method 'count'), or
+    'grover'  -> ancilla-free Grover search with an unknown number of solutions ('qGrover.search_unknown', method
+                 'grover'), while the search register has at most 'max_grover_qubits' qubits (count beyond that)
+    'build'   -> the oracle of 'construction' (a name of 'qBench.CONSTRUCTIONS') on the preprocessed pairs
+    'verify'  -> the oracle evaluated with 'qClassical' on the coloring found, which it must accept
+The sweep stops at the first c with a solution. Every stage is timed:
+
+    >>> result = qSweep.chromatic_sweep(nodes, edges)
+    >>> result.colors, [(stage.colors, stage.solutions, stage.timings) for stage in result.stages]
+
+The builders lay out the search register node by node (qubit node*c + k), so the gate blocks of c and c + 1 act on
+different qubits; what is shared between color counts is the graph work, done once here and passed to the builders.
+"""
+import collections
+import time
+
+import numpy as np
+
+import gatesUPCT
+import qSolutions
+
+GraphInfo = collections.namedtuple('GraphInfo', ['pairs', 'neighbors', 'degrees', 'clique', 'greedy_coloring'])
+GraphInfo.__doc__ = """ Result of 'preprocess': checked pairs, their neighbor sets and degree counts, greedy clique (lower
+    bound) and greedy coloring (its number of colors is an upper bound) """
+
+SweepStage = collections.namedtuple('SweepStage', ['colors', 'solutions', 'coloring', 'qubits', 'oracle_ok', 'timings'])
+SweepStage.__doc__ = """ One color count of 'chromatic_sweep': number of solutions (None when Grover did not count them),
+    coloring found (one color per node) or None, width of the oracle, whether the oracle accepts the coloring and the
+    seconds spent in every stage """
+
+SweepResult = collections.namedtuple('SweepResult', ['colors', 'lower_bound', 'upper_bound', 'stages', 'timings'])
+SweepResult.__doc__ = """ Result of 'chromatic_sweep': smallest number of colors found, bounds of the preprocessing,
+    'SweepStage' of every color count tried and total seconds per stage """
+
+
+def greedy_coloring(neighbors, degrees):
+    ''' Largest-degree-first greedy coloring: list with the color of every node '''
+    coloring = [None] * len(neighbors)
+    for v in sorted(range(len(neighbors)), key=lambda v: -degrees[v]):
+        used = {coloring[w] for w in neighbors[v]}
+        coloring[v] = next(color for color in range(len(neighbors) + 1) if color not in used)
+    return coloring
+
+
+def preprocess(nodes, edges, use_extendedEdges=False):
+    ''' Work of the sweep that does not depend on the number of colors, as a 'GraphInfo' '''
+    pairs = gatesUPCT.get_extended_edges(nodes, edges) if use_extendedEdges else list(edges)
+    neighbors = [set() for _ in range(nodes)]
+    for a, b in pairs:
+        neighbors[a].add(b)
+        neighbors[b].add(a)
+    degrees = [len(neighbors[v]) for v in range(nodes)]
+    clique = gatesUPCT.symmetry_breaking_clique(nodes, pairs, nodes)
+    return GraphInfo(pairs, neighbors, degrees, clique, greedy_coloring(neighbors, degrees))
+
+
+def _lowest_colors(masks):
+    # lowest color of every node: a one-color coloring in both semantics
+    return [(mask & -mask).bit_length() - 1 for mask in masks]
+
+
+def _coloring_row(coloring, colors):
+    row = np.zeros((1, len(coloring) * colors), dtype=bool)
+    row[0, [node * colors + color for node, color in enumerate(coloring)]] = True
+    return row
+
+
+def chromatic_sweep(nodes, edges, use_extendedEdges=False, method='count', construction='oracle_creator_parallel',
+                    build=True, min_colors=None, max_colors=None, max_grover_qubits=20, seed=None):
+    ''' Smallest number of colors of the graph (of its checked pairs with 'use_extendedEdges') found by sweeping c; see
+        the module docstring. 'min_colors'/'max_colors' override the bounds of the preprocessing; without 'build' only
+        the classical or Grover stage runs.
+    '''
+    if method not in ('count', 'grover'):
+        raise ValueError(f"Unknown method '{method}', expected 'count' or 'grover'")
+    import qBench
+    builder, one_color, uncompute = qBench.CONSTRUCTIONS[construction]
+    totals = collections.Counter()
+    start = time.perf_counter()
+    info = preprocess(nodes, edges, use_extendedEdges)
+    totals['preprocess'] = time.perf_counter() - start
+    lower = max(len(info.clique), 1) if min_colors is None else min_colors
+    upper = max(info.greedy_coloring, default=-1) + 1 if max_colors is None else max_colors
+
+    stages = []
+    for colors in range(lower, max(upper, lower) + 1):
+        timings = {}
+        solutions = coloring = None
+        start = time.perf_counter()
+        if method == 'grover' and nodes * colors <= max_grover_qubits:
+            import qGrover
+            mask = qGrover.phase_mask(nodes, info.pairs, colors, one_color)
+            index, _ = qGrover.search_unknown(mask, seed=seed)
+            if index is not None:
+                coloring = _lowest_colors(qSolutions.index_to_masks(index, nodes, colors))
+            timings['grover'] = time.perf_counter() - start
+        else:
+            solutions = qSolutions.count_colorings(nodes, info.pairs, colors, one_color)
+            if solutions:
+                coloring = _lowest_colors(next(qSolutions.iter_colorings(nodes, info.pairs, colors, one_color)))
+            timings['count'] = time.perf_counter() - start
+
+        qubits = oracle_ok = None
+        if build:
+            start = time.perf_counter()
+            oracle = builder(nodes, info.pairs, colors)
+            timings['build'] = time.perf_counter() - start
+            qubits = oracle.num_qubits
+            if coloring is not None:
+                import qClassical
+                start = time.perf_counter()
+                res = qClassical.evaluate_oracle(oracle, nodes, colors, inputs=_coloring_row(coloring, colors),
+                                                 uncompute=uncompute)
+                oracle_ok = bool(res.output[0] and res.ancillas_clean[0])
+                timings['verify'] = time.perf_counter() - start
+        totals.update(timings)
+        stages.append(SweepStage(colors, solutions, coloring, qubits, oracle_ok, timings))
+        if coloring is not None:
+            return SweepResult(colors, lower, upper, stages, dict(totals))
+    return SweepResult(None, lower, upper, stages, dict(totals))
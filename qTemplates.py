@@ -0,0 +1,161 @@
+"""
+Template-based translation of the oracles to a target basis: every distinct motif is translated once and stitched.
+
+The oracles repeat a handful of motifs many times (the X-MCX-X of every node, the CCX of every edge and color, the
+counter steps of 'qCounters', the diffuser, the Grover block). 'TemplateTranspiler' splits a circuit into motifs, gives
+each one a signature (its gates with the qubits relabelled in order of first use), translates one representative per
+signature with the PassManager ('qCache.eagle_pass_manager' by default) and builds the output by copying the translated
+template onto the qubits of every occurrence. The PassManager runs once per distinct motif; the rest is a linear copy.
+
+    >>> translator = qTemplates.TemplateTranspiler(qCache.EAGLE_BASIS)
+    >>> transpiled = translator.run(oracle)          # same gates as qCache.eagle_pass_manager().run(oracle)
+    >>> translator.hits, translator.misses, len(translator)
+
+'granularity' chooses the motifs:
+    'instruction' -> every gate is a motif (MCX with the same controls and mode, CCX, custom gates by definition).
+                     With the translation-only PassManager the output has the same gates as translating the whole circuit.
+    'barrier'     -> the gates between two barriers are a motif (one clause of 'oracle_creator', one node of
+                     'oracle_creator_CdC_OH'), for PassManagers that also optimize inside the motif.
+Measurements, resets, barriers and other non-gate instructions are copied as they are and end the current motif.
+"""
+import numpy as np
+import qiskit
+from qiskit.circuit import ControlledGate
+from qiskit.circuit.library import get_standard_gate_name_mapping
+
+import qCache
+
+_STANDARD_GATES = frozenset(get_standard_gate_name_mapping())
+
+
+def _param_key(param):
+    if isinstance(param, np.ndarray):
+        return ('array', param.shape, param.tobytes())
+    if isinstance(param, qiskit.circuit.ParameterExpression):
+        return ('expr', str(param))
+    try:
+        hash(param)
+    except TypeError:
+        return ('repr', repr(param))
+    return param
+
+
+def operation_key(operation, _memo=None):
+    ''' Hashable description of a gate that identifies its translation: name, size and parameters; for controlled
+        gates the control state, the base gate and their mode flags (clean or dirty v-chain); for gates outside the
+        standard library, the signature of their definition (computed once per gate object).
+    '''
+    memo = {} if _memo is None else _memo
+    cached = memo.get(id(operation))
+    if cached is not None and cached[0] is operation:
+        return cached[1]
+    key = (type(operation).__qualname__, operation.name, operation.num_qubits, operation.num_clbits,
+           tuple(_param_key(p) for p in operation.params))
+    if isinstance(operation, ControlledGate):
+        flags = tuple(sorted((name, value) for name, value in vars(operation).items() if isinstance(value, bool)))
+        key += (operation.ctrl_state, operation_key(operation.base_gate, memo), flags)
+    elif operation.name not in _STANDARD_GATES and getattr(operation, 'definition', None) is not None:
+        key += (circuit_signature(operation.definition, memo),)
+    memo[id(operation)] = (operation, key)
+    return key
+
+
+def circuit_signature(circuit, _memo=None):
+    ''' Tuple of (operation key, qubit indexes, clbit indexes) of every instruction, plus the global phase '''
+    memo = {} if _memo is None else _memo
+    return (tuple((operation_key(inst.operation, memo), tuple(circuit.find_bit(q).index for q in inst.qubits),
+                   tuple(circuit.find_bit(c).index for c in inst.clbits)) for inst in circuit.data),
+            _param_key(circuit.global_phase))
+
+
+def _is_motif_gate(inst):
+    return (isinstance(inst.operation, qiskit.circuit.Gate) and not inst.clbits
+            and getattr(inst.operation, 'condition', None) is None)
+
+
+def split_motifs(circuit, granularity='instruction'):
+    ''' Yields ('motif', qubit indexes in order of first use, instructions) and ('other', None, [instruction]) items
+        covering 'circuit' in order (see the module docstring for 'granularity')
+    '''
+    if granularity not in ('instruction', 'barrier'):
+        raise ValueError(f"Unknown granularity '{granularity}'")
+    index = {q: i for i, q in enumerate(circuit.qubits)}
+    current, qubits, seen = [], [], set()
+    for inst in circuit.data:
+        if not _is_motif_gate(inst):
+            if current:
+                yield 'motif', qubits, current
+                current, qubits, seen = [], [], set()
+            yield 'other', None, [inst]
+            continue
+        if granularity == 'instruction':
+            yield 'motif', [index[q] for q in inst.qubits], [inst]
+            continue
+        current.append(inst)
+        for q in inst.qubits:
+            if q not in seen:
+                seen.add(q)
+                qubits.append(index[q])
+    if current:
+        yield 'motif', qubits, current
+
+
+class TemplateTranspiler:
+    """ Translates circuits motif by motif, keeping the translated templates (by signature) between calls """
+
+    def __init__(self, basis_gates=qCache.EAGLE_BASIS, pass_manager=None, granularity='instruction', keep_barriers=True):
+        self.basis_gates = tuple(basis_gates)
+        self.pass_manager = pass_manager if pass_manager is not None else qCache.eagle_pass_manager(basis_gates)
+        self.granularity = granularity
+        self.keep_barriers = keep_barriers
+        self.hits = 0
+        self.misses = 0
+        self.__templates = {}
+
+    def __len__(self):
+        return len(self.__templates)
+
+    def clear(self):
+        self.__templates.clear()
+
+    def template(self, instructions, qubits, circuit, memo=None):
+        ''' Translated template of a motif (a circuit on the motif's qubits, in order of first use) '''
+        memo = {} if memo is None else memo
+        local = {circuit.qubits[q]: i for i, q in enumerate(qubits)}
+        signature = tuple((operation_key(inst.operation, memo), tuple(local[q] for q in inst.qubits))
+                          for inst in instructions)
+        template = self.__templates.get(signature)
+        if template is not None:
+            self.hits += 1
+            return template
+        self.misses += 1
+        motif = qiskit.QuantumCircuit(len(qubits))
+        for inst in instructions:
+            motif.append(inst.operation, [local[q] for q in inst.qubits])
+        template = self.pass_manager.run(motif)
+        self.__templates[signature] = template
+        return template
+
+    def run(self, circuit):
+        ''' Translated copy of 'circuit' (same registers), built from the templates of its motifs '''
+        out = circuit.copy_empty_like()
+        memo = {}
+        for kind, qubits, instructions in split_motifs(circuit, self.granularity):
+            if kind == 'other':
+                inst = instructions[0]
+                if self.keep_barriers or inst.operation.name != 'barrier':
+                    out._append(inst)
+                continue
+            out.compose(self.template(instructions, qubits, circuit, memo), qubits, inplace=True, copy=False)
+        return out
+
+
+_translators = {}
+
+
+def template_transpile(circuit, basis_gates=qCache.EAGLE_BASIS, granularity='instruction'):
+    ''' 'TemplateTranspiler.run' with one module-level translator per basis and granularity, so templates are shared '''
+    key = (tuple(basis_gates), granularity)
+    if key not in _translators:
+        _translators[key] = TemplateTranspiler(basis_gates, granularity=granularity)
+    return _translators[key].run(circuit)
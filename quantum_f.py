@@ -1,6 +1,7 @@
 import qiskit
+import functools
 import math, cmath
-from termcolor import colored
+import numpy as np
 
 ## delete if new version woks
 def or_gate_old (qc, input_qbits, output_qbit):
@@ -15,28 +16,109 @@ def nor_gate_old (qc, input_qbits, output_qbit):
     qc.x(output_qbit)
 
 
-def or_gate (qc, input_qbits, output_qbit):
-    nor_gate (qc, input_qbits, output_qbit)
+MCX_STRATEGIES = ('noancilla', 'v-chain', 'v-chain-dirty', 'tree', 'auto')
+
+def _mcx_tree (qc, controls, target, ancillas):
+    # log-depth AND tree of CCX on clean ancillas (len(controls)-2 of them), target, and uncompute of the tree
+    layer = list(controls)
+    computed = []
+    while len(layer) > 2:
+        next_layer = []
+        for i in range(0, len(layer) - 1, 2):
+            ancilla = ancillas[len(computed)]
+            qc.ccx(layer[i], layer[i+1], ancilla)
+            computed.append((layer[i], layer[i+1], ancilla))
+            next_layer.append(ancilla)
+        if len(layer) % 2:
+            next_layer.append(layer[-1])
+        layer = next_layer
+    if len(layer) == 2:
+        qc.ccx(layer[0], layer[1], target)
+    else:
+        qc.cx(layer[0], target)
+    for a, b, ancilla in reversed(computed):
+        qc.ccx(a, b, ancilla)
+
+def _apply_mcx (qc, controls, target, strategy, clean_qbits, dirty_qbits):
+    needed = len(controls) - 2
+    if strategy == 'v-chain' and len(clean_qbits) >= needed:
+        qc.mcx(controls, target, list(clean_qbits)[:needed], mode='v-chain')
+    elif strategy == 'v-chain-dirty' and len(dirty_qbits) + len(clean_qbits) >= needed:
+        qc.mcx(controls, target, (list(clean_qbits) + list(dirty_qbits))[:needed], mode='v-chain-dirty')
+    elif strategy == 'tree' and len(clean_qbits) >= needed:
+        _mcx_tree(qc, controls, target, list(clean_qbits))
+    else:
+        qc.mcx(controls, target)
+
+def best_mcx_strategy (n_controls, n_clean, n_dirty, basis_gates=('sx', 'x', 'rz', 'ecr')):
+    ''' Strategy with the lowest two-qubit gate count after translating to 'basis_gates' for an MCX with 'n_controls'
+        controls when 'n_clean' clean and 'n_dirty' dirty idle qubits are available (results are cached by size).
+        No decomposition uses more than n_controls-2 ancillas, so the counts are clamped to that before the cache
+        lookup: the builders, where the idle qubits differ for every node, hit the cache after the first node.
+    '''
+    if n_controls <= 2:
+        return 'noancilla'
+    needed = n_controls - 2
+    n_clean = min(n_clean, needed)
+    return _best_mcx_strategy(n_controls, n_clean, min(n_dirty, needed - n_clean), tuple(basis_gates))
+
+@functools.lru_cache(maxsize=None)
+def _best_mcx_strategy (n_controls, n_clean, n_dirty, basis_gates):
+    # trial circuits only as wide as the controls, the target and the clamped ancillas
+    import qCache
+    pass_manager = qCache.eagle_pass_manager(basis_gates)
+    costs = {}
+    for strategy in MCX_STRATEGIES[:-1]:
+        qc = qiskit.QuantumCircuit(n_controls + 1 + n_clean + n_dirty)
+        clean = list(range(n_controls + 1, n_controls + 1 + n_clean))
+        dirty = list(range(n_controls + 1 + n_clean, qc.num_qubits))
+        _apply_mcx(qc, list(range(n_controls)), n_controls, strategy, clean, dirty)
+        ops = pass_manager.run(qc).count_ops()
+        costs[strategy] = (sum(n for name, n in ops.items() if name in ('ecr', 'cx', 'cz')), sum(ops.values()))
+    return min(costs, key=costs.get)
+
+def mcx (qc, input_qbits, output_qbit, strategy='noancilla', clean_qbits=(), dirty_qbits=()):
+    ''' MCX with a selectable decomposition: 'noancilla' (plain 'qc.mcx'), 'v-chain' (needs len(input_qbits)-2 clean
+        ancillas), 'v-chain-dirty' (dirty ancillas: any idle qubit, its value is restored), 'tree' (log-depth CCX tree on
+        clean ancillas) or 'auto' (the one of 'best_mcx_strategy' for the available qubits). 'clean_qbits' are idle
+        qubits known to be |0>, 'dirty_qbits' idle qubits in any state; strategies without enough of them fall back to
+        'noancilla'.
+    '''
+    input_qbits = list(input_qbits)
+    if strategy == 'auto':
+        strategy = best_mcx_strategy(len(input_qbits), len(clean_qbits), len(dirty_qbits))
+    _apply_mcx(qc, input_qbits, output_qbit, strategy, clean_qbits, dirty_qbits)
+
+
+def or_gate (qc, input_qbits, output_qbit, strategy='noancilla', clean_qbits=(), dirty_qbits=()):
+    nor_gate (qc, input_qbits, output_qbit, strategy, clean_qbits, dirty_qbits)
     qc.x(output_qbit)
 
-def nor_gate (qc, input_qbits, output_qbit):
+def nor_gate (qc, input_qbits, output_qbit, strategy='noancilla', clean_qbits=(), dirty_qbits=()):
     qc.x(input_qbits)
-    qc.mcx(input_qbits, output_qbit)
+    mcx(qc, input_qbits, output_qbit, strategy, clean_qbits, dirty_qbits)
     qc.x(input_qbits)
 
     
 
-def and_gate (qc, input_qbits, output_qbit):
-    qc.mcx(input_qbits, output_qbit)
+def and_gate (qc, input_qbits, output_qbit, strategy='noancilla', clean_qbits=(), dirty_qbits=()):
+    mcx(qc, input_qbits, output_qbit, strategy, clean_qbits, dirty_qbits)
 
-def nand_gate (qc, input_qbits, output_qbit):
-    and_gate (qc, input_qbits, output_qbit)
+def nand_gate (qc, input_qbits, output_qbit, strategy='noancilla', clean_qbits=(), dirty_qbits=()):
+    and_gate (qc, input_qbits, output_qbit, strategy, clean_qbits, dirty_qbits)
     qc.x(output_qbit)
 
-def phase_and (qc, input_qbits):
-    g = qiskit.circuit.library.ZGate()
-    g = g.control(len(input_qbits)-1)
-    qc.append(g,input_qbits)
+def phase_and (qc, input_qbits, strategy='noancilla', clean_qbits=(), dirty_qbits=()):
+    ''' Multi-controlled Z on 'input_qbits'; with a strategy other than 'noancilla' it is H-MCX-H on the last qubit '''
+    if strategy == 'noancilla':
+        g = qiskit.circuit.library.ZGate()
+        g = g.control(len(input_qbits)-1)
+        qc.append(g,input_qbits)
+        return
+    input_qbits = list(input_qbits)
+    qc.h(input_qbits[-1])
+    mcx(qc, input_qbits[:-1], input_qbits[-1], strategy, clean_qbits, dirty_qbits)
+    qc.h(input_qbits[-1])
 
 
 def add_diffuser(qc, q_registers): # lo he probado con solo un valor para *q_registers
@@ -49,16 +131,24 @@ def add_diffuser(qc, q_registers): # lo he probado con solo un valor para *q_reg
         qc.h(i)
     return qc
 
-    
+
+@functools.lru_cache(maxsize=8)
+def _generic_backend(n_qubits):
+    from qiskit.providers.fake_provider import GenericBackendV2
+    return GenericBackendV2(num_qubits=n_qubits)
+
 def simulate_qc(qc, n_qubits, n_shots=1024, plot_histogram=True) -> list:
     ''' Simulates the QuantumCircuit "qc", plots the histogram and return the results of the simulation 
+        The backend is reused between calls with the same 'n_qubits'; use 'qRunner.run_circuits' for batches of circuits
     '''
-    simulator_backend = qiskit.providers.fake_provider.GenericBackendV2(num_qubits=n_qubits)
-    circuit_to_instruction = qiskit.compiler.transpile(qc, backend=simulator_backend)
-    job = simulator_backend.run(qc, shots = n_shots)
+    simulator_backend = _generic_backend(n_qubits)
+    transpiled_qc = qiskit.compiler.transpile(qc, backend=simulator_backend)
+    job = simulator_backend.run(transpiled_qc, shots = n_shots)
     result = job.result()
-    counts = result.get_counts(qc)
-    if plot_histogram: qiskit.visualization.plot_histogram(counts)
+    counts = result.get_counts(transpiled_qc)
+    if plot_histogram:
+        import qiskit.visualization
+        qiskit.visualization.plot_histogram(counts)
     return counts
 
 def flatten_list (list_of_lists):
@@ -68,44 +158,132 @@ def flatten_list (list_of_lists):
     return flat_list
 
 
+def _amplitudes(statevector):
+    return statevector.data if hasattr(statevector, 'data') else np.asarray(statevector)
+
+
+def _chunks(size, chunk_size):
+    for start in range(0, size, chunk_size):
+        yield start, min(start + chunk_size, size)
+
+
+PHASE_ZERO_PROB, PHASE_0, PHASE_PI, PHASE_OTHER = 0, 1, 2, 3
+PHASE_CLASSES = (PHASE_ZERO_PROB, PHASE_0, PHASE_PI, PHASE_OTHER)
+
+def classify_phases (statevector, shown=PHASE_CLASSES, abs_tol=1e-6, chunk_size=1<<22):
+    ''' Vectorized classification of the amplitudes: PHASE_ZERO_PROB (probability ~0), PHASE_0, PHASE_PI or PHASE_OTHER.
+        Yields, chunk by chunk, (positions, int8 classes, probabilities, phases) of the amplitudes whose class is in
+        'shown'; only those hits are kept, so memory is bounded by the chunk and the hits, not by the statevector
+    '''
+    data = _amplitudes(statevector)
+    shown = np.asarray(sorted(shown), dtype=np.int8)
+    for start, end in _chunks(len(data), chunk_size):
+        amp = data[start:end]
+        prob = np.abs(amp) ** 2
+        phase = np.angle(amp)
+        cls = np.full(len(amp), PHASE_OTHER, dtype=np.int8)
+        cls[np.abs(phase) <= abs_tol] = PHASE_0
+        cls[np.abs(np.abs(phase) - math.pi) <= abs_tol] = PHASE_PI
+        cls[prob <= abs_tol] = PHASE_ZERO_PROB
+        hits = np.flatnonzero(np.isin(cls, shown))
+        if len(hits):
+            yield hits + start, cls[hits], prob[hits], phase[hits]
+
+
 def print_state (statevector, num_cols=0, print_only_z=True, print_0_prob=False):
     ''' Prints the statevector (calculated as 'qiskit.quantum_info.Statevector(qc)' ) showing the kets and their probabilities
         The user can select whether states with 0 probability are to be shown and the number of columns to organize the output
         Numbers in blue have phase 0 and in yellow phase PI
+        Amplitudes are classified with 'classify_phases'; strings are only built for the states that get printed
     '''
+    from termcolor import colored
     num_cols=statevector.num_qubits/2 if num_cols==0 else num_cols
-    for pos, val in enumerate(statevector.data):
-        prob=abs(val)**2
-        phase=cmath.phase(val)
-        txt=f"|{pos:0{statevector.num_qubits}b}\u232A: {prob*100:.3f}%"
-        fin = '\n' if (pos+1)%num_cols==0 else '\t'
-        if math.isclose(prob,0,abs_tol=1e-6): 
-            if print_0_prob: 
+    shown = {PHASE_PI}
+    if print_0_prob: shown.add(PHASE_ZERO_PROB)
+    if not print_only_z: shown.update({PHASE_0, PHASE_OTHER})
+    for positions, classes, probs, phases in classify_phases(statevector, shown):
+        for pos, cls, prob, phase in zip(positions.tolist(), classes, probs, phases):
+            txt=f"|{pos:0{statevector.num_qubits}b}\u232A: {prob*100:.3f}%"
+            fin = '\n' if (pos+1)%num_cols==0 else '\t'
+            if cls==PHASE_ZERO_PROB:
                 print(colored(txt, 'white'), end=fin)
-        elif math.isclose(phase, 0, abs_tol=1e-6) and not print_only_z:
-            print(colored(txt, 'blue',attrs=["bold"]), end=fin)
-        elif math.isclose(phase,math.pi,abs_tol=1e-6) or math.isclose(phase,-math.pi,abs_tol=1e-6):
-            print(colored(txt, 'yellow', attrs=["bold"]), end=fin)
-        elif not print_only_z:
-            print(colored(txt+f"({phase})", 'red', attrs=["bold"]), end=fin)
+            elif cls==PHASE_0:
+                print(colored(txt, 'blue',attrs=["bold"]), end=fin)
+            elif cls==PHASE_PI:
+                print(colored(txt, 'yellow', attrs=["bold"]), end=fin)
+            else:
+                print(colored(txt+f"({phase})", 'red', attrs=["bold"]), end=fin)
 
 
 def get_rotated_combinations (statevector):
-    lista=[]
-    for pos, val in enumerate(statevector.data):
-        prob=abs(val)**2
-        phase=cmath.phase(val)
-        if math.isclose(phase,math.pi,abs_tol=1e-6) or math.isclose(phase,-math.pi,abs_tol=1e-6):
-            #lista.append(f"|{pos:0{statevector.num_qubits}b}\u232A: {prob:.3f}")
-            lista.append([pos, prob])
-    return lista
+    ''' [position, probability] of every amplitude with phase PI (also the ones with probability ~0) '''
+    rotated = []
+    for positions, _, probs, phases in classify_phases(statevector, (PHASE_PI, PHASE_ZERO_PROB)):
+        pi = np.abs(np.abs(phases) - math.pi) <= 1e-6
+        rotated.extend([int(pos), float(prob)] for pos, prob in zip(positions[pi], probs[pi]))
+    return rotated
 
 
 # retorna una pareja de valores
 def max_prob_combinations(statevector):
-    probabilidades = statevector.probabilities_dict()
-    # Encontrar el valor máximo de probabilidad
-    max_probabilidad = max(probabilidades.values())
-    # Encontrar las combinaciones binarias que tienen el valor máximo de probabilidad
-    combinaciones_max_prob = [estado for estado, prob in probabilidades.items() if math.isclose(prob,max_probabilidad,abs_tol=1e-6)  ]
-    return max_probabilidad, combinaciones_max_prob
\ No newline at end of file
+    ''' Maximum probability and the bitstrings that reach it (within 1e-6), without building 'probabilities_dict()' '''
+    probs = np.abs(_amplitudes(statevector)) ** 2
+    max_probabilidad = float(probs.max())
+    posiciones = np.flatnonzero(np.abs(probs - max_probabilidad) <= 1e-6)
+    combinaciones_max_prob = [f"{pos:0{statevector.num_qubits}b}" for pos in posiciones]
+    return max_probabilidad, combinaciones_max_prob
+
+
+def top_k_states (statevector, k, chunk_size=1<<22):
+    ''' The 'k' most probable basis states as (positions, probabilities), sorted by decreasing probability.
+        Works chunk by chunk with 'argpartition', keeping only k candidates in memory
+    '''
+    data = _amplitudes(statevector)
+    best_pos = np.zeros(0, dtype=np.int64)
+    best_prob = np.zeros(0)
+    if k <= 0:
+        return best_pos, best_prob
+    for start, end in _chunks(len(data), chunk_size):
+        prob = np.abs(data[start:end]) ** 2
+        if len(prob) > k:
+            part = np.argpartition(prob, -k)[-k:]
+        else:
+            part = np.arange(len(prob))
+        best_pos = np.concatenate([best_pos, part + start])
+        best_prob = np.concatenate([best_prob, prob[part]])
+        if len(best_prob) > k:
+            keep = np.argpartition(best_prob, -k)[-k:]
+            best_pos, best_prob = best_pos[keep], best_prob[keep]
+    order = np.argsort(-best_prob, kind='stable')
+    return best_pos[order], best_prob[order]
+
+
+def register_marginal (statevector, qubits, chunk_size=1<<22):
+    ''' Probability distribution over the basis states of 'qubits' (bit j of the result index <-> qubits[j]),
+        tracing out the rest, e.g. the search register of an oracle without its ancillas
+    '''
+    data = _amplitudes(statevector)
+    result = np.zeros(2 ** len(qubits))
+    for start, end in _chunks(len(data), chunk_size):
+        idx = np.arange(start, end, dtype=np.int64)
+        sub = np.zeros(len(idx), dtype=np.int64)
+        for j, q in enumerate(qubits):
+            sub |= ((idx >> q) & 1) << j
+        result += np.bincount(sub, weights=np.abs(data[start:end]) ** 2, minlength=len(result))
+    return result
+
+
+def node_color_marginals (statevector, nodes, colors, chunk_size=1<<22):
+    ''' Per-node marginals of a one-hot coloring register (qubit node*colors+color):
+        returns (P(color qubit = 1) as a nodes x colors array, distribution of each node's color mask as a nodes x 2^colors array)
+    '''
+    data = _amplitudes(statevector)
+    field = 2 ** colors - 1
+    masks = np.zeros((nodes, 2 ** colors))
+    for start, end in _chunks(len(data), chunk_size):
+        idx = np.arange(start, end, dtype=np.int64)
+        prob = np.abs(data[start:end]) ** 2
+        for v in range(nodes):
+            masks[v] += np.bincount((idx >> (v * colors)) & field, weights=prob, minlength=2 ** colors)
+    bits = (np.arange(2 ** colors)[:, None] >> np.arange(colors)[None, :]) & 1
+    return masks @ bits, masks
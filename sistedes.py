@@ -0,0 +1,212 @@
+"""
+Batch command line over the oracle builders: build, verify, simulate and benchmark coloring oracles for graphs in files.
+
+    python sistedes.py build graph.txt -c 3 --construction oracle_creator --out oracle.qpy
+    python sistedes.py build graph.txt -c 3 --construction oracle_creator_budget --peephole --transpile
+    python sistedes.py verify graph1.txt graph2.json -c 3
+    python sistedes.py verify graph.txt -c 3 --assignment 0 1 2 0 1 2
+    python sistedes.py simulate graph.txt -c 3 --top 5
+    python sistedes.py sweep graph.txt --method grover
+    python sistedes.py bench --families path cycle --sizes 4 6
+
+A graph file is either JSON ({"nodes": 6, "edges": [[0, 1], ...]}, 'nodes' optional) or text with one edge per line
+("0 1", "0,1" or "0-1"), '#' comments and an optional "nodes N" line; without it the nodes are 0 ... max index.
+Every command prints one JSON line per graph, so the output of many workers can be concatenated. Only the modules a
+command needs are imported, and none of the visualization or provider packages.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# name -> (function of gatesUPCT, one_color semantics, needs uncompute to be evaluated); see 'qBench.CONSTRUCTIONS'
+BUILDERS = {
+    'oracle_creator': ('oracle_creator', False, True),
+    'oracle_creator_Grover': ('oracle_creator_Grover', False, False),
+    'oracle_creator_CdC_OH': ('oracle_creator_CdC_OH', True, True),
+    'oracle_creator_budget': ('oracle_creator_budget', False, False),
+    'oracle_creator_parallel': ('oracle_creator_parallel', False, True),
+    'oracle_creator_counters': ('oracle_creator_counters', True, False),
+}
+
+
+def read_graph(path):
+    ''' (nodes, edges) of a graph file (see the module docstring for the formats) '''
+    with open(path) as f:
+        text = f.read()
+    if path.endswith('.json'):
+        data = json.loads(text)
+        edges = [tuple(int(v) for v in edge) for edge in data['edges']]
+        nodes = data.get('nodes')
+    else:
+        edges, nodes = [], None
+        for line in text.splitlines():
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            fields = re.split(r'[\s,\-]+', line)
+            if fields[0].lower() == 'nodes':
+                nodes = int(fields[1])
+            else:
+                edges.append((int(fields[0]), int(fields[1])))
+    if nodes is None:
+        nodes = 1 + max((max(edge) for edge in edges), default=-1)
+    return int(nodes), edges
+
+
+def _build(args, nodes, edges):
+    import gatesUPCT
+    import qCache
+    name, one_color, uncompute = BUILDERS[args.construction]
+    start = time.perf_counter()
+    oracle = qCache.call_builder(getattr(gatesUPCT, name), nodes, edges, args.colors, args.extended)
+    return oracle, one_color, uncompute, time.perf_counter() - start
+
+
+def _checked_edges(args, nodes, edges):
+    # the edges the oracle actually checks
+    if not args.extended:
+        return edges
+    import gatesUPCT
+    return gatesUPCT.get_extended_edges(nodes, edges)
+
+
+def cmd_build(args, path, nodes, edges):
+    oracle, _, _, build_time = _build(args, nodes, edges)
+    record = {'qubits': oracle.num_qubits, 'depth': oracle.depth(), 'size': oracle.size(),
+              'build_time': build_time}
+    if args.peephole:
+        import qPeephole
+        start = time.perf_counter()
+        oracle, report = qPeephole.peephole(oracle)
+        record.update({'peephole_size': report.size_after, 'peephole_removed': report.removed,
+                       'peephole_time': time.perf_counter() - start})
+    if args.transpile:
+        import qTemplates
+        start = time.perf_counter()
+        oracle = qTemplates.template_transpile(oracle)
+        record.update({'transpiled_depth': oracle.depth(), 'transpiled_size': oracle.size(),
+                       'transpile_time': time.perf_counter() - start})
+    if args.out:
+        import qiskit.qpy
+        out = args.out if len(args.graphs) == 1 else os.path.splitext(path)[0] + '_' + os.path.basename(args.out)
+        with open(out, 'wb') as f:
+            qiskit.qpy.dump(oracle, f)
+        record['out'] = out
+    return record
+
+
+def cmd_verify(args, path, nodes, edges):
+    import numpy as np
+    import qClassical
+    import qSolutions
+    oracle, one_color, uncompute, _ = _build(args, nodes, edges)
+    checked = _checked_edges(args, nodes, edges)
+    if args.assignment is not None:
+        if len(args.assignment) != nodes:
+            raise SystemExit(f"{path}: --assignment needs {nodes} colors, got {len(args.assignment)}")
+        row = np.zeros((1, nodes * args.colors), dtype=bool)
+        row[0, [node * args.colors + color for node, color in enumerate(args.assignment)]] = True
+        res = qClassical.evaluate_oracle(oracle, nodes, args.colors, inputs=row, uncompute=uncompute)
+        expected = qSolutions.is_valid_coloring(row[0].astype(int), checked, args.colors, one_color)
+        return {'assignment': args.assignment, 'output': bool(res.output[0]), 'expected': bool(expected),
+                'ancillas_clean': bool(res.ancillas_clean[0]), 'ok': bool(res.output[0] == expected and res.ancillas_clean[0])}
+    start = time.perf_counter()
+    res = qClassical.evaluate_oracle(oracle, nodes, args.colors, uncompute=uncompute)
+    solutions = int(res.output.sum())
+    expected = qSolutions.count_colorings(nodes, checked, args.colors, one_color)
+    return {'solutions': solutions, 'expected': expected, 'ancillas_clean': bool(res.ancillas_clean.all()),
+            'simulate_time': time.perf_counter() - start, 'ok': bool(solutions == expected and res.ancillas_clean.all())}
+
+
+def cmd_simulate(args, path, nodes, edges):
+    import numpy as np
+    import qGrover
+    import qSolutions
+    checked = _checked_edges(args, nodes, edges)
+    plan = qGrover.plan_iterations(nodes, checked, args.colors, args.one_color)
+    iterations = plan.iterations if args.iterations is None else args.iterations
+    mask = qGrover.phase_mask(nodes, checked, args.colors, args.one_color)
+    probs = qGrover.simulate_grover(mask, iterations) ** 2
+    top = np.argsort(-probs, kind='stable')[:args.top]
+    record = {'search_qubits': plan.search_qubits, 'solutions': plan.solutions, 'iterations': iterations,
+              'success_probability': qGrover.success_probability(np.sqrt(probs), mask),
+              'top': [{'masks': qSolutions.index_to_masks(i, nodes, args.colors), 'probability': float(probs[i]),
+                       'valid': bool(mask[i])} for i in top]}
+    if args.shots:
+        rng = np.random.default_rng(args.seed)
+        shots = rng.choice(len(probs), size=args.shots, p=probs / probs.sum())
+        record['shots_valid'] = int(mask[shots].sum())
+    return record
+
+
+def cmd_sweep(args, path, nodes, edges):
+    import qSweep
+    result = qSweep.chromatic_sweep(nodes, edges, args.extended, args.method, args.construction, not args.no_build,
+                                    args.min_colors, args.max_colors, seed=args.seed)
+    return {'colors': result.colors, 'lower_bound': result.lower_bound, 'upper_bound': result.upper_bound,
+            'stages': [stage._asdict() for stage in result.stages], 'timings': result.timings,
+            'ok': result.colors is not None and all(stage.oracle_ok is not False for stage in result.stages)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sistedes', description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def graph_command(name, help_text, colors=True):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('graphs', nargs='+', help='graph files (JSON or edge list)')
+        if colors:
+            command.add_argument('-c', '--colors', type=int, required=True)
+        command.add_argument('--extended', action='store_true', help='also check the nodes at distance two')
+        return command
+
+    build = graph_command('build', 'build an oracle and report its resources')
+    build.add_argument('--construction', default='oracle_creator', choices=list(BUILDERS))
+    build.add_argument('--peephole', action='store_true', help="optimize with 'qPeephole' before translating")
+    build.add_argument('--transpile', action='store_true', help="translate to the Eagle basis with 'qTemplates'")
+    build.add_argument('--out', help='QPY file for the circuit (prefixed with the graph name when there are several graphs)')
+
+    verify = graph_command('verify', 'check an oracle against the exact classical count')
+    verify.add_argument('--construction', default='oracle_creator', choices=list(BUILDERS))
+    verify.add_argument('--assignment', type=int, nargs='+', help='check only this coloring (one color per node)')
+
+    simulate = graph_command('simulate', 'ancilla-free Grover simulation of the search register')
+    simulate.add_argument('--one-color', action='store_true', help='exactly one color per node')
+    simulate.add_argument('--iterations', type=int, help='default: the optimal number of iterations')
+    simulate.add_argument('--top', type=int, default=5)
+    simulate.add_argument('--shots', type=int, default=0)
+    simulate.add_argument('--seed', type=int, default=1234)
+
+    sweep = graph_command('sweep', 'smallest number of colors, sweeping c from the clique bound', colors=False)
+    sweep.add_argument('--method', default='count', choices=['count', 'grover'])
+    sweep.add_argument('--construction', default='oracle_creator_parallel', help="name of 'qBench.CONSTRUCTIONS'")
+    sweep.add_argument('--no-build', action='store_true', help='only the classical or Grover stage')
+    sweep.add_argument('--min-colors', type=int)
+    sweep.add_argument('--max-colors', type=int)
+    sweep.add_argument('--seed', type=int, default=1234)
+
+    commands.add_parser('bench', help="benchmark of the constructions (arguments of 'qBench.py')", add_help=False)
+
+    args, rest = parser.parse_known_args(argv)
+    if args.command == 'bench':
+        import qBench
+        return qBench.main(rest)
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+    handler = {'build': cmd_build, 'verify': cmd_verify, 'simulate': cmd_simulate, 'sweep': cmd_sweep}[args.command]
+    status = 0
+    for path in args.graphs:
+        nodes, edges = read_graph(path)
+        record = {'graph': path, 'nodes': nodes, 'edges': len(edges), 'colors': getattr(args, 'colors', None)}
+        record.update(handler(args, path, nodes, edges))
+        status |= record.get('ok', True) is False
+        print(json.dumps(record), flush=True)
+    return int(status)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAPER_GRAPH = (6, [(0, 1), (1, 2), (2, 3), (1, 3), (0, 4), (2, 5)], 3)
+SMALL_GRAPHS = [(4, [(0, 1), (1, 2), (2, 3), (3, 0)], 2), PAPER_GRAPH]
@@ -0,0 +1,19 @@
+import pytest
+
+import gatesUPCT
+import qClassical
+import qSolutions
+from conftest import SMALL_GRAPHS
+
+
+@pytest.mark.parametrize('nodes, edges, colors', SMALL_GRAPHS)
+def test_oracles_agree_with_exact_count(nodes, edges, colors):
+    # the oracles of 'gatesUPCT' must agree with the exact classical counter of 'qSolutions'
+    expected_more = qSolutions.count_colorings(nodes, edges, colors, one_color=False)
+    expected_one = qSolutions.count_colorings(nodes, edges, colors, one_color=True)
+    res = qClassical.evaluate_oracle(gatesUPCT.oracle_creator(nodes, edges, colors), nodes, colors, uncompute=True)
+    assert res.output.sum() == expected_more and res.ancillas_clean.all() and res.inputs_restored.all()
+    res = qClassical.evaluate_oracle(gatesUPCT.oracle_creator_Grover(nodes, edges, colors), nodes, colors)
+    assert res.output.sum() == expected_more and res.ancillas_clean.all()
+    res = qClassical.evaluate_oracle(gatesUPCT.oracle_creator_CdC_OH(nodes, colors, edges), nodes, colors, uncompute=True)
+    assert res.output.sum() == expected_one and res.ancillas_clean.all()
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+import qSolutions
+import qStore
+from qShots import ShotAggregator, color_masks, decode_one_hot, shot_keys
+
+
+@pytest.mark.parametrize('nodes, colors, extra_bits', [(6, 3, 3), (9, 8, 5)])
+def test_keys_aggregation_and_decoding(nodes, colors, extra_bits):
+    # packed bytes, integers and memory strings give the same keys, and the bulk decoding agrees with
+    # 'qSolutions.index_to_masks'
+    rng = np.random.default_rng(1234)
+    width = nodes * colors
+    indexes = [int.from_bytes(rng.bytes(16), 'big') % (1 << (width + extra_bits)) for _ in range(1000)]
+    indexes += indexes[:300]
+    size = -(-(width + extra_bits) // 8)
+    packed = np.array([list(i.to_bytes(size, 'big')) for i in indexes], dtype=np.uint8)
+    expected = qStore.to_keys([i & ((1 << width) - 1) for i in indexes], width)
+    assert np.array_equal(shot_keys(packed, width), expected)
+    assert np.array_equal(shot_keys([hex(i) for i in indexes], width), expected)
+
+    keys, counts = np.unique(expected, return_counts=True)
+    aggregator = ShotAggregator(width, chunk_shots=128).add(packed[:500])
+    aggregator.merge(ShotAggregator(width).add(packed[500:]))
+    assert np.array_equal(aggregator.keys, keys)
+    assert np.array_equal(aggregator.counts, counts)
+    assert aggregator.shots == len(indexes)
+
+    masks = [qSolutions.index_to_masks(qStore.from_key(key, width), nodes, colors) for key in keys]
+    assert color_masks(keys, nodes, colors).tolist() == [list(m) for m in masks]
+    one_hot = [[m.bit_length() - 1 if m and not m & (m - 1) else -1 for m in row] for row in masks]
+    assert decode_one_hot(keys, nodes, colors, chunk_size=100).tolist() == one_hot
@@ -0,0 +1,15 @@
+import pytest
+
+import qSolutions
+from conftest import SMALL_GRAPHS
+
+
+@pytest.mark.parametrize('one_color', [True, False])
+@pytest.mark.parametrize('nodes, edges, colors', SMALL_GRAPHS)
+def test_counters_agree(nodes, edges, colors, one_color):
+    # the DP counter, the vectorized enumeration, the backtracking generator and the brute force must agree
+    counts = {qSolutions.count_colorings(nodes, edges, colors, one_color),
+              qSolutions.count_colorings_bruteforce(nodes, edges, colors, one_color),
+              len(qSolutions.solution_indexes(nodes, edges, colors, one_color)),
+              sum(1 for _ in qSolutions.iter_colorings(nodes, edges, colors, one_color))}
+    assert len(counts) == 1, counts
@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pytest
+
+import qSolutions
+from conftest import PAPER_GRAPH
+from qStore import SolutionStore, read_solutions_text, score_counts
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('path, encoding', [('allSolutions_oneColor.txt', 'one_hot'),
+                                            ('allSolutions_moreThanOneColor.txt', 'one_hot_multi')])
+def test_text_files_match_store(tmp_path, path, encoding):
+    # the kets of the text files are the solutions computed by 'qSolutions', and a store round-trips them
+    nodes, edges, colors = PAPER_GRAPH
+    text = read_solutions_text(os.path.join(ROOT, path))
+    solutions = SolutionStore(str(tmp_path)).get(nodes, edges, colors, encoding)
+    assert np.array_equal(np.sort(text), solutions.keys)
+    counts = {format(int(i), '018b'): 10 for i in text[:5]} | {'0' * 18: 10}
+    score = score_counts(counts, solutions, top_k=6)
+    assert score.found == 5
+    assert abs(score.success_probability - 5 / 6) < 1e-12
+    assert len(score.missing) == len(text) - 5
+
+
+def test_wide_register(tmp_path):
+    # K9 minus one edge with 8 colors: the two free nodes share a color, 8! colorings on a 72-qubit register
+    edges = [(a, b) for a in range(9) for b in range(a + 1, 9) if (a, b) != (0, 1)]
+    wide = SolutionStore(str(tmp_path)).get(9, edges, 8, 'one_hot')
+    valid = set(qSolutions.iter_colorings(9, edges, 8))
+    assert len(wide) == 40320
+    assert 2 ** 72 - 1 not in wide
+    assert all(masks in valid for masks in wide.masks())
+    score = score_counts(({0: 1, wide.indexes()[7]: 3}.keys(), [1, 3]), wide)
+    assert score.found == 1 and score.success_probability == 0.75